@@ -0,0 +1,112 @@
+import re
+import sys
+import timeit
+
+from kjv_pipeline import (
+    BOOK_TITLES, REMOVE_KJV_ONLINE, JUNK_START, UNDERSCORE_ONLY,
+    BOOK_TITLE_DASHED, CHAPTER_ONLY, BOOK_CHAPTER_LINE, VERSE_LINE,
+    BOOK_CHAPTER_TRIE, CANONICAL_ORDER, classify_line,
+)
+
+# Micro-benchmarks: classify_line against the regex chain from the stage17
+# builder, and the book chapter trie against the old regexes, on a
+# reordered text file (the kjv_formatted.txt that
+# re-ordering processing.py writes, or kjv_pipeline.py --reordered).
+
+INPUT_FILE = "kjv_formatted.txt"
+REPEAT = 5
+
+# The 66-way alternation of clean_kjv.py (CHAPTER_PATTERN) and
+# clean_kjv_stage4.py/stage5.py (BOOK_CHAPTER)
+BOOK_CHAPTER = re.compile(
+    r'^(' + '|'.join(re.escape(book) for book in CANONICAL_ORDER) + r')\s+(\d+)$'
+)
+
+
+def classify_line_chain(raw):
+    """The stage17 main loop's sequence of regex calls, returning classify_line's tuple."""
+    line = raw.rstrip()
+    line = REMOVE_KJV_ONLINE.sub('', line)
+    line = JUNK_START.sub('', line)
+
+    if not line.strip() or UNDERSCORE_ONLY.match(line):
+        return ('spacer', line, ())
+
+    dashed = BOOK_TITLE_DASHED.match(line)
+    if dashed:
+        book = dashed.group(1).strip()
+        if book in BOOK_TITLES:
+            return ('book', line, (book,))
+
+    if CHAPTER_ONLY.match(line):
+        return ('chapter', line, (None, line))
+
+    bc = BOOK_CHAPTER_LINE.match(line)
+    if bc:
+        return ('chapter', line, bc.groups())
+
+    verse = VERSE_LINE.match(line)
+    if verse:
+        return ('verse', line, verse.groups())
+
+    return ('heading', line, ())
+
+
+def run_benchmark(input_file=INPUT_FILE, repeat=REPEAT):
+    with open(input_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+
+    mismatches = [line for line in lines if classify_line(line) != classify_line_chain(line)]
+    if mismatches:
+        print(f"{len(mismatches)} lines classified differently, first: {mismatches[0]!r}")
+        return False
+
+    chain = min(timeit.repeat(lambda: [classify_line_chain(l) for l in lines], number=1, repeat=repeat))
+    one_shot = min(timeit.repeat(lambda: [classify_line(l) for l in lines], number=1, repeat=repeat))
+
+    print(f"{len(lines)} lines, identical results")
+    print(f"regex chain:   {chain * 1000:8.1f} ms  ({chain / len(lines) * 1e6:.2f} us/line)")
+    print(f"classify_line: {one_shot * 1000:8.1f} ms  ({one_shot / len(lines) * 1e6:.2f} us/line)")
+    print(f"speedup:       {chain / one_shot:.2f}x")
+    return True
+
+
+def run_book_chapter_benchmark(input_file=INPUT_FILE, repeat=REPEAT):
+    """BOOK_CHAPTER_TRIE against the alternation and BOOK_CHAPTER_LINE on every line."""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        lines = [line.rstrip() for line in f]
+
+    def alternation(line):
+        m = BOOK_CHAPTER.match(line)
+        return m.groups() if m else None
+
+    def broad(line):
+        m = BOOK_CHAPTER_LINE.match(line)
+        return m.groups() if m else None
+
+    mismatches = [line for line in lines if BOOK_CHAPTER_TRIE.match_chapter_line(line) != alternation(line)]
+    if mismatches:
+        print(f"{len(mismatches)} lines matched differently from the alternation, first: {mismatches[0]!r}")
+        return False
+    matched = sum(1 for line in lines if alternation(line))
+    over_broad = sum(1 for line in lines if broad(line) and not alternation(line))
+
+    timings = [
+        ('alternation', alternation),
+        ('BOOK_CHAPTER_LINE', broad),
+        ('trie', BOOK_CHAPTER_TRIE.match_chapter_line),
+    ]
+    print(f"{len(lines)} lines, {matched} book chapter lines, trie agrees with the alternation")
+    print(f"BOOK_CHAPTER_LINE also matches {over_broad} lines that are not book chapter lines")
+    for name, match in timings:
+        best = min(timeit.repeat(lambda: [match(l) for l in lines], number=1, repeat=repeat))
+        print(f"{name + ':':19}{best * 1000:8.1f} ms  ({best / len(lines) * 1e6:.2f} us/line)")
+    return True
+
+
+if __name__ == "__main__":
+    input_file = sys.argv[1] if len(sys.argv) > 1 else INPUT_FILE
+    ok = run_benchmark(input_file)
+    print()
+    ok = run_book_chapter_benchmark(input_file) and ok
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,265 @@
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from docx import Document
+
+from kjv_corpus import Corpus
+from kjv_docx_stream import styled_block_xml, write_document
+from kjv_pipeline import (
+    INPUT_FILE, CUSTOM_ORDER, RunBuilder, add_front_matter, add_styles,
+    iter_blocks, iter_normalized_lines, iter_reordered_lines, render_styled_blocks,
+)
+from process_bible import normalize_file
+
+# Stage-by-stage benchmark of the pipeline. Every stage runs in a fresh
+# process that first computes only the inputs that stage needs, and
+# records the stage's wall time, the peak RSS while it ran and the size
+# of what it produced. Runs are appended to a JSON history keyed by
+# commit, and --compare flags the stages that got slower or bigger
+# between two of them.
+#
+# process_bible times process_bible.py's normalize_file from the source
+# to a file. The other stages time the code the builders run: normalize
+# is iter_normalized_lines, and parse and reorder are Corpus.from_lines
+# and iter_reordered_lines, which replaced parse_source_file and
+# reorder_and_output (re-ordering processing.py needs pythonbible just
+# to be imported).
+#
+#   python bench_pipeline.py kjv_source.txt            # measure and record
+#   python bench_pipeline.py --compare                 # last two records
+#   python bench_pipeline.py --compare 612f676 HEAD    # two commits
+
+HISTORY_FILE = "bench_history.json"
+REPEAT = 3
+THRESHOLD = 0.10
+# differences below these are noise, whatever the ratio
+MIN_SECONDS = 0.02
+MIN_RSS_KB = 2048
+
+STAGES = ['process_bible', 'normalize', 'parse', 'reorder', 'classify', 'build', 'save', 'stream']
+
+
+def reset_peak_rss():
+    """Restart the peak RSS from the current RSS where the OS allows it (Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def stage_plan(input_file, output_dir):
+    """{stage: (stage whose result it takes, function of that result, size of its own result)}"""
+    normalized_file = os.path.join(output_dir, 'normalized.txt')
+    tree_file = os.path.join(output_dir, 'tree.docx')
+    stream_file = os.path.join(output_dir, 'stream.docx')
+
+    def build(blocks):
+        doc = Document()
+        add_front_matter(doc)
+        add_styles(doc)
+        render_styled_blocks(doc, blocks, RunBuilder())
+        return doc
+
+    def stream(blocks):
+        runs = RunBuilder()
+        write_document((styled_block_xml(b, runs) for b in blocks), stream_file)
+
+    return {
+        'process_bible': (None, lambda _: normalize_file(input_file, normalized_file),
+                          lambda _: os.path.getsize(normalized_file)),
+        'normalize': (None, lambda _: list(iter_normalized_lines(input_file)), len),
+        'parse': ('normalize', Corpus.from_lines, lambda c: len(c.text)),
+        'reorder': ('parse', lambda corpus: list(iter_reordered_lines(corpus, CUSTOM_ORDER)), len),
+        'classify': ('reorder', lambda lines: list(iter_blocks(lines)), len),
+        'build': ('classify', build, lambda d: len(d.paragraphs)),
+        'save': ('build', lambda doc: doc.save(tree_file), lambda _: os.path.getsize(tree_file)),
+        'stream': ('classify', stream, lambda _: os.path.getsize(stream_file)),
+    }
+
+
+def run_stage(name, input_file, output_dir):
+    """Run the stages name depends on, then measure name itself.
+
+    The peak RSS is restarted once the inputs are ready, so it covers the
+    stage and the inputs it holds, not an earlier stage's high-water mark.
+    Where it can't be restarted it also includes the inputs' peaks.
+    """
+    plan = stage_plan(input_file, output_dir)
+    chain = []
+    needed = plan[name][0]
+    while needed:
+        chain.append(needed)
+        needed = plan[needed][0]
+    value = None
+    for prerequisite in reversed(chain):
+        value = plan[prerequisite][1](value)
+
+    gc.collect()
+    reset_peak_rss()
+    _, fn, size = plan[name]
+    start = time.perf_counter()
+    result = fn(value)
+    wall = time.perf_counter() - start
+    return {'wall': wall, 'peak_rss_kb': peak_rss_kb(), 'output_size': size(result)}
+
+
+def run_isolated(input_file):
+    """Every stage in a child process of its own, so no stage sees another's peak RSS."""
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name in STAGES:
+            with ProcessPoolExecutor(1) as pool:
+                results[name] = pool.submit(run_stage, name, os.path.abspath(input_file), output_dir).result()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def measure(input_file, repeat=REPEAT):
+    """Best wall time of repeat runs per stage; peak RSS and size from the same runs."""
+    runs = [run_isolated(input_file) for _ in range(repeat)]
+    stages = {}
+    for name in STAGES:
+        samples = [run[name] for run in runs]
+        peaks = [s['peak_rss_kb'] for s in samples if s['peak_rss_kb'] is not None]
+        stages[name] = {
+            'wall': min(s['wall'] for s in samples),
+            'peak_rss_kb': min(peaks) if peaks else None,
+            'output_size': samples[0]['output_size'],
+        }
+    return {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'input': os.path.basename(input_file),
+        'python': sys.version.split()[0],
+        'repeat': repeat,
+        'stages': stages,
+    }
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp, path)
+
+
+def find_record(history, ref):
+    """Latest record whose commit starts with ref (HEAD is the current commit)."""
+    if ref == 'HEAD':
+        ref = git_commit().replace('-dirty', '')
+    for record in reversed(history):
+        if record['commit'].startswith(ref):
+            return record
+    raise SystemExit(f"no benchmark record for {ref!r} in the history")
+
+
+def compare(old, new, threshold=THRESHOLD):
+    """Print old against new stage by stage; returns the regressed stages."""
+    print(f"{old['commit']} ({old['date']}) -> {new['commit']} ({new['date']})")
+    print(f"{'stage':13} {'wall s':>17} {'change':>8}   {'peak RSS MB':>15} {'change':>8}   {'output':>21}")
+
+    regressions = []
+    for name in STAGES:
+        a, b = old['stages'].get(name), new['stages'].get(name)
+        if not a or not b:
+            continue
+        flags = []
+
+        wall = (b['wall'] - a['wall']) / a['wall'] if a['wall'] else 0.0
+        if wall > threshold and b['wall'] - a['wall'] > MIN_SECONDS:
+            flags.append('time')
+
+        rss = 0.0
+        if a['peak_rss_kb'] and b['peak_rss_kb']:
+            rss = (b['peak_rss_kb'] - a['peak_rss_kb']) / a['peak_rss_kb']
+            if rss > threshold and b['peak_rss_kb'] - a['peak_rss_kb'] > MIN_RSS_KB:
+                flags.append('memory')
+
+        if b['output_size'] != a['output_size']:
+            flags.append('output changed')
+
+        if 'time' in flags or 'memory' in flags:
+            regressions.append(name)
+        print(f"{name:13} {a['wall']:8.3f}{b['wall']:9.3f} {wall:+8.1%}   "
+              f"{(a['peak_rss_kb'] or 0) / 1024:7.1f}{(b['peak_rss_kb'] or 0) / 1024:8.1f} {rss:+8.1%}   "
+              f"{a['output_size']:10}{b['output_size']:11}  {' '.join(flags)}")
+    return regressions
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time each pipeline stage and track the results per commit.")
+    parser.add_argument("input", nargs="?", default=INPUT_FILE)
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSON file the results are appended to")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per measurement; the fastest counts")
+    parser.add_argument("--compare", nargs="*", metavar="COMMIT",
+                        help="compare two recorded commits (default: the last two records) instead of measuring")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="relative slowdown or growth that counts as a regression (default: 0.10)")
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    if args.compare is not None:
+        if len(args.compare) == 2:
+            old, new = (find_record(history, ref) for ref in args.compare)
+        elif not args.compare and len(history) >= 2:
+            old, new = history[-2], history[-1]
+        else:
+            raise SystemExit("--compare takes two commits, or none to compare the last two records")
+        regressions = compare(old, new, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1 if regressions else 0)
+
+    record = measure(args.input, args.repeat)
+    history.append(record)
+    save_history(args.history, history)
+    for name in STAGES:
+        stage = record['stages'][name]
+        rss = f"{stage['peak_rss_kb'] / 1024:7.1f} MB" if stage['peak_rss_kb'] else "      n/a"
+        print(f"{name:13} {stage['wall']:8.3f} s  {rss}  {stage['output_size']:>10}")
+    print(f"Recorded {record['commit']} in {args.history}")
@@ -0,0 +1,98 @@
+import contextlib
+import hashlib
+import os
+
+# On-disk cache of rendered book fragments for kjv_docx_stream.
+# A fragment is keyed by the book's normalized text, the layout settings
+# and the source of the renderer itself, so editing one chapter (or the
+# renderer) only invalidates what actually changed.
+
+CACHE_DIR = ".kjv_cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+RENDERER_FILES = ("kjv_pipeline.py", "kjv_docx_stream.py")
+CACHE_FORMAT = "2"
+
+
+def renderer_fingerprint(files=RENDERER_FILES):
+    """Hash of the renderer sources; any code change invalidates every entry."""
+    h = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in files:
+        with open(os.path.join(here, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def book_key(book_name, chapters, *settings):
+    """Hash of a book's {chapter: [segmented lines]} text and the settings it is rendered with."""
+    h = hashlib.sha256()
+    for part in (*settings, book_name):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    for chap_num in sorted(chapters):
+        h.update(f"{chap_num}\n".encode('utf-8'))
+        for line in chapters[chap_num]:
+            for text, italic in line:
+                h.update(b'\1' if italic else b'\2')
+                h.update(text.encode('utf-8'))
+            h.update(b'\n')
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class BookCache:
+    """Rendered (xml, runs, saved) results per book, evicted least recently used first."""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = renderer_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, book_name, chapters, styled):
+        return book_key(book_name, chapters, CACHE_FORMAT, self.fingerprint, str(styled))
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.xml')
+
+    def get(self, key):
+        """(xml, runs, saved) stored under key, or None if it isn't (or was just evicted)."""
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                runs, saved = f.readline().split()
+                xml = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # mtime doubles as the last-used time for eviction
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return xml, int(runs), int(saved)
+
+    def put(self, key, result):
+        xml, runs, saved = result
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8', newline='') as f:
+            f.write(f"{runs} {saved}\n")
+            f.write(xml)
+        os.replace(tmp, path)
+
+    def evict(self):
+        """Delete the least recently used fragments until the cache fits max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.xml'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
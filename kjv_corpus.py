@@ -0,0 +1,320 @@
+import mmap
+import struct
+import sys
+from array import array
+
+from kjv_pipeline import (
+    SOURCE_HEADER, iter_normalized_lines, plain_text, standardize_book_name, strip_segments,
+)
+
+# Compact replacement for the {book: {chapter: lines}} dict that
+# parse_source_file builds. All text lives in one UTF-8 buffer; lines,
+# chapters and verses are rows of parallel array columns holding
+# offsets into it, so the whole Bible costs a handful of objects instead
+# of one dict per book plus one string per line. Italic segments are
+# byte ranges of that buffer, so the text itself carries no markup.
+
+# ================= BINARY FORMAT =================
+# A compiled corpus file is the header, the book names, every column in
+# COLUMNS order and then the text blob, each section starting on an
+# 8-byte boundary. Columns are stored in the byte order of the machine
+# that wrote them, so load() can hand out memoryview casts of the mmap
+# instead of parsing anything.
+CORPUS_EXT = ".kjvc"
+CORPUS_MAGIC = b'KJVC'
+CORPUS_VERSION = 4
+# magic, version, big-endian flag, book count, line, chapter, verse and
+# italic counts, names length, text length
+HEADER = struct.Struct('<4sHBxIQQQQQQ')
+COLUMNS = [
+    ('line_offset', 'Q', 'lines'),
+    ('line_length', 'I', 'lines'),
+    ('line_italic_start', 'I', 'lines'),
+    ('line_italic_stop', 'I', 'lines'),
+    ('chapter_book', 'H', 'chapters'),
+    ('chapter_number', 'I', 'chapters'),
+    ('chapter_line_start', 'I', 'chapters'),
+    ('chapter_line_stop', 'I', 'chapters'),
+    ('chapter_verse_start', 'I', 'chapters'),
+    ('chapter_verse_stop', 'I', 'chapters'),
+    ('verse_book', 'H', 'verses'),
+    ('verse_chapter', 'I', 'verses'),
+    ('verse_number', 'I', 'verses'),
+    ('verse_offset', 'Q', 'verses'),
+    ('verse_length', 'I', 'verses'),
+    ('italic_start', 'Q', 'italics'),
+    ('italic_stop', 'Q', 'italics'),
+]
+# book ids index the names and are stored in the 'H' book columns
+MAX_BOOKS = 1 << 16
+
+
+def aligned(pos):
+    return (pos + 7) & ~7
+
+
+# Verse numbers inside a paragraph are followed by a narrow no-break space
+VERSE_MARK = '\u202f'.encode('utf-8')
+
+
+def find_verse_marks(data):
+    """(number start, text start, number) for every run of digits followed by U+202F.
+
+    Finding the mark with bytes.find and walking back over the digits
+    gives the same matches as a regex, several times faster than letting
+    it try a digit run at every position of the line.
+    """
+    marks = []
+    pos = data.find(VERSE_MARK)
+    while pos != -1:
+        start = pos
+        while start and 48 <= data[start - 1] <= 57:
+            start -= 1
+        if start < pos:
+            marks.append((start, pos + len(VERSE_MARK), int(data[start:pos])))
+        pos = data.find(VERSE_MARK, pos + len(VERSE_MARK))
+    return marks
+
+
+class Corpus:
+    """Books, chapters, lines and verses of the normalized text in array columns.
+
+    Reading it like the old dict still works: ``book in corpus``,
+    ``corpus[book]`` (a {chapter: [segmented lines]} dict built on demand) and
+    ``corpus.keys()``, so iter_reordered_lines and the renderers take it
+    unchanged. A chapter that appears twice in the source replaces the
+    earlier one, as it did in the dict; the superseded rows stay in the
+    columns but are no longer reachable through the chapter index.
+    """
+
+    def __init__(self):
+        self.text = bytearray()
+        self.book_names = []
+        self.book_ids = {}
+
+        # one row per stored line; its italics are a contiguous row range
+        self.line_offset = array('Q')
+        self.line_length = array('I')
+        self.line_italic_start = array('I')
+        self.line_italic_stop = array('I')
+
+        # one row per chapter; lines and verses are contiguous row ranges
+        self.chapter_book = array('H')
+        self.chapter_number = array('I')
+        self.chapter_line_start = array('I')
+        self.chapter_line_stop = array('I')
+        self.chapter_verse_start = array('I')
+        self.chapter_verse_stop = array('I')
+        # book id -> {chapter number: chapter row}
+        self.chapter_index = {}
+
+        # one row per verse found in a line
+        self.verse_book = array('H')
+        self.verse_chapter = array('I')
+        self.verse_number = array('I')
+        self.verse_offset = array('Q')
+        self.verse_length = array('I')
+
+        # one row per italic segment, as a byte range of text
+        self.italic_start = array('Q')
+        self.italic_stop = array('Q')
+
+        self._open = None
+
+    # ================= BUILDING =================
+    @classmethod
+    def from_lines(cls, lines):
+        """Parse normalized lines exactly as parse_lines does."""
+        corpus = cls()
+        for segments in lines:
+            line = plain_text(segments).strip()
+            if not line:
+                continue
+
+            try:
+                match = SOURCE_HEADER.match(line)
+                if match:
+                    corpus.close_chapter()
+                    book = standardize_book_name(match.group(1).strip())
+                    if book:
+                        corpus.open_chapter(book, int(match.group(2)))
+                elif corpus._open is not None:
+                    corpus.add_line(strip_segments(segments))
+            except OverflowError:
+                raise ValueError(f"chapter or verse number out of range in line: {line[:80]!r}") from None
+
+        corpus.close_chapter()
+        return corpus
+
+    def open_chapter(self, book, chapter):
+        book_id = self.book_ids.get(book)
+        if book_id is None:
+            if len(self.book_names) == MAX_BOOKS:
+                raise ValueError(f"too many books: {book!r} would be book {MAX_BOOKS + 1}, "
+                                 f"a corpus holds at most {MAX_BOOKS}")
+            book_id = self.book_ids[book] = len(self.book_names)
+            self.book_names.append(book)
+
+        self._open = (book_id, chapter)
+        self.chapter_book.append(book_id)
+        self.chapter_number.append(chapter)
+        self.chapter_line_start.append(len(self.line_offset))
+        self.chapter_verse_start.append(len(self.verse_offset))
+
+    def close_chapter(self):
+        if self._open is None:
+            return
+        self.chapter_line_stop.append(len(self.line_offset))
+        self.chapter_verse_stop.append(len(self.verse_offset))
+        book_id, chapter = self._open
+        self.chapter_index.setdefault(book_id, {})[chapter] = len(self.chapter_book) - 1
+        self._open = None
+
+    def add_line(self, segments):
+        pieces = [text.encode('utf-8') for text, _ in segments]
+        data = b''.join(pieces)
+        offset = len(self.text)
+        self.text += data
+        self.line_offset.append(offset)
+        self.line_length.append(len(data))
+
+        self.line_italic_start.append(len(self.italic_start))
+        pos = offset
+        for (_, italic), piece in zip(segments, pieces):
+            if italic:
+                self.italic_start.append(pos)
+                self.italic_stop.append(pos + len(piece))
+            pos += len(piece)
+        self.line_italic_stop.append(len(self.italic_start))
+
+        # a verse runs from its number to the next number or the end of the line
+        book_id, chapter = self._open
+        marks = find_verse_marks(data)
+        for i, (_, start, number) in enumerate(marks):
+            stop = marks[i + 1][0] if i + 1 < len(marks) else len(data)
+            self.verse_book.append(book_id)
+            self.verse_chapter.append(chapter)
+            self.verse_number.append(number)
+            self.verse_offset.append(offset + start)
+            self.verse_length.append(len(data[start:stop].rstrip()))
+
+    # ================= COMPILED FILES =================
+    def save(self, path):
+        """Write the corpus in the compiled format that load() maps back in."""
+        names = '\n'.join(self.book_names).encode('utf-8')
+        counts = {
+            'lines': len(self.line_offset),
+            'chapters': len(self.chapter_book),
+            'verses': len(self.verse_offset),
+            'italics': len(self.italic_start),
+        }
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(
+                CORPUS_MAGIC, CORPUS_VERSION, sys.byteorder == 'big', len(self.book_names),
+                counts['lines'], counts['chapters'], counts['verses'], counts['italics'],
+                len(names), len(self.text),
+            ))
+            for section in [names] + [getattr(self, name) for name, _, _ in COLUMNS] + [self.text]:
+                f.write(b'\0' * (aligned(f.tell()) - f.tell()))
+                f.write(section)
+
+    @classmethod
+    def load(cls, path):
+        """Map a compiled corpus file; columns and text are views of the mapping, not copies."""
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+
+        (magic, version, big_endian, book_count, lines, chapters, verses, italics,
+         names_length, text_length) = HEADER.unpack_from(view)
+        if magic != CORPUS_MAGIC or version != CORPUS_VERSION:
+            raise ValueError(f"{path} is not a version {CORPUS_VERSION} compiled corpus")
+        if big_endian != (sys.byteorder == 'big'):
+            raise ValueError(f"{path} was compiled on a machine with the other byte order")
+        counts = {'lines': lines, 'chapters': chapters, 'verses': verses, 'italics': italics}
+
+        corpus = cls()
+        corpus._mapping = mapping
+        pos = aligned(HEADER.size)
+        names = str(view[pos:pos + names_length], 'utf-8')
+        corpus.book_names = names.split('\n') if book_count else []
+        corpus.book_ids = {name: book_id for book_id, name in enumerate(corpus.book_names)}
+        pos += names_length
+
+        for name, code, rows in COLUMNS:
+            pos = aligned(pos)
+            size = counts[rows] * struct.calcsize(code)
+            setattr(corpus, name, view[pos:pos + size].cast(code))
+            pos += size
+
+        pos = aligned(pos)
+        corpus.text = view[pos:pos + text_length]
+
+        # later rows win, as they did when the chapters were first parsed
+        for row in range(chapters):
+            book_id = corpus.chapter_book[row]
+            corpus.chapter_index.setdefault(book_id, {})[corpus.chapter_number[row]] = row
+        return corpus
+
+    # ================= ACCESS =================
+    def slice(self, offset, length):
+        return str(self.text[offset:offset + length], 'utf-8')
+
+    def chapter_rows(self, book):
+        """Chapter rows of book that the index still points to, by chapter number."""
+        chapters = self.chapter_index.get(self.book_ids.get(book), {})
+        return [chapters[chapter] for chapter in sorted(chapters)]
+
+    def line_segments(self, row):
+        """The (text, italic) segments of a stored line."""
+        segments = []
+        pos = self.line_offset[row]
+        for i in range(self.line_italic_start[row], self.line_italic_stop[row]):
+            start, stop = self.italic_start[i], self.italic_stop[i]
+            if start > pos:
+                segments.append((self.slice(pos, start - pos), False))
+            segments.append((self.slice(start, stop - start), True))
+            pos = stop
+        end = self.line_offset[row] + self.line_length[row]
+        if end > pos:
+            segments.append((self.slice(pos, end - pos), False))
+        return tuple(segments)
+
+    def chapter_lines(self, row):
+        return [self.line_segments(i)
+                for i in range(self.chapter_line_start[row], self.chapter_line_stop[row])]
+
+    def verse_rows(self, row):
+        """Verse rows of a chapter row, as a range into the verse columns."""
+        return range(self.chapter_verse_start[row], self.chapter_verse_stop[row])
+
+    def verse_text(self, row):
+        """Plain text of a verse, italics dropped."""
+        return self.slice(self.verse_offset[row], self.verse_length[row])
+
+    # ================= DICT COMPATIBILITY =================
+    def keys(self):
+        """Books in order of appearance, like the dict's insertion order."""
+        return [name for book_id, name in enumerate(self.book_names) if book_id in self.chapter_index]
+
+    def __len__(self):
+        return len(self.chapter_index)
+
+    def __contains__(self, book):
+        return self.book_ids.get(book) in self.chapter_index
+
+    def __getitem__(self, book):
+        if book not in self:
+            raise KeyError(book)
+        return {self.chapter_number[row]: self.chapter_lines(row) for row in self.chapter_rows(book)}
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    # Compile a source text once: python kjv_corpus.py kjv_source.txt kjv.kjvc
+    input_file = sys.argv[1] if len(sys.argv) > 1 else "kjv_source.txt"
+    output_file = sys.argv[2] if len(sys.argv) > 2 else "kjv" + CORPUS_EXT
+
+    corpus = Corpus.from_lines(iter_normalized_lines(input_file))
+    corpus.save(output_file)
+    print(f"Compiled {len(corpus)} books, {len(corpus.verse_offset)} verses into {output_file}")
@@ -0,0 +1,402 @@
+import argparse
+import re
+import sys
+import zipfile
+from collections import deque, namedtuple
+from itertools import islice
+from xml.etree import ElementTree
+
+from kjv_docx_source import RUN_TEXT, W, W_R, W_RPR, W_VAL, OFF, iter_body_paragraphs
+from kjv_pipeline import BOOK_TITLES, CUSTOM_ORDER
+
+# Structural diff of two built documents, e.g. KJV_Cleaned.docx against
+# KJV_Cleaned_Final.docx, or a renderer rewrite against the stage17
+# output. Both word/document.xml parts are streamed side by side and
+# every paragraph is reduced to (style, text, formatting spans), so two
+# documents that Word would show the same way compare equal however
+# their runs happen to be split. Differences are reported by verse
+# reference:
+#
+#   python kjv_docx_diff.py KJV_Cleaned.docx KJV_Cleaned_Final.docx
+#   python kjv_docx_diff.py old.docx new.docx --text-only --limit 20
+#
+# --resolve-styles compares what the styles amount to instead of which
+# styles are used, so a styled build and a directly formatted one match.
+
+W_PPR = W + 'pPr'
+W_PSTYLE = W + 'pStyle'
+W_JC = W + 'jc'
+W_BR = W + 'br'
+W_TYPE = W + 'type'
+W_ASCII = W + 'ascii'
+W_STYLE = W + 'style'
+W_STYLE_ID = W + 'styleId'
+W_BASED_ON = W + 'basedOn'
+W_RPR_DEFAULT = W + 'rPrDefault'
+STYLES_PART = "word/styles.xml"
+# run properties that don't change how the text looks
+IGNORED_PROPS = {'lang', 'noProof', 'webHidden', 'rsid', 'szCs', 'bCs', 'iCs'}
+
+# Paragraphs held back while looking for where the two documents line up again
+WINDOW = 64
+# Paragraphs held back waiting for the verse that places them, before
+# they are given up on as unlocated
+HELD_PARAGRAPHS = 256
+CONTEXT = 30
+
+# style is the paragraph style id, plus the alignment if it is set
+# directly; spans are (start, stop, format) over text, format being the
+# sorted (property, value) pairs of the run
+Paragraph = namedtuple('Paragraph', 'style text spans')
+
+BOOK_NAMES = {book.upper(): book for book in CUSTOM_ORDER}
+# a verse number is followed by a (narrow no-break) space; the KJV spells
+# every other number out
+VERSE_MARK = re.compile(r'(?:^|(?<=\s))(\d+)[\u202F\u00A0 ](?=\S)')
+# the older layout (KJV_Cleaned.docx) opens a book with "--- Genesis ---"
+# and a chapter with a paragraph holding just its number
+BOOK_MARKER = re.compile(r'--- (.+) ---')
+CHAPTER_NUMBER = re.compile(r'\d+')
+
+
+# ================= PARAGRAPHS =================
+def run_props(props):
+    """{name: value} of a w:rPr; toggles that are off map to None."""
+    values = {}
+    if props is None:
+        return values
+    for prop in props:
+        name = prop.tag.rpartition('}')[2]
+        if name in IGNORED_PROPS:
+            continue
+        value = prop.get(W_ASCII if name == 'rFonts' else W_VAL)
+        values[name] = None if value in OFF else value or ''
+    return values
+
+
+def run_format(values):
+    """Sorted (name, value) pairs of run_props() that are set."""
+    return tuple(sorted((name, value) for name, value in values.items() if value is not None))
+
+
+class StyleSheet:
+    """The styles of a .docx, flattened through basedOn for --resolve-styles.
+
+    paragraph(style_id) gives the alignment and run properties a paragraph
+    style amounts to, on top of the document defaults; character(style_id)
+    the run properties of a character style.
+    """
+
+    def __init__(self, filepath):
+        self.styles = {}
+        self.defaults = {}
+        with zipfile.ZipFile(filepath) as zf:
+            if STYLES_PART not in zf.namelist():
+                return
+            root = ElementTree.fromstring(zf.read(STYLES_PART))
+        default = root.find(f'.//{W_RPR_DEFAULT}/{W_RPR}')
+        self.defaults = run_props(default)
+        for style in root.iter(W_STYLE):
+            based_on = style.find(W_BASED_ON)
+            props = style.find(W_PPR)
+            jc = props.find(W_JC) if props is not None else None
+            self.styles[style.get(W_STYLE_ID)] = (
+                based_on.get(W_VAL) if based_on is not None else None,
+                jc.get(W_VAL) if jc is not None else None,
+                run_props(style.find(W_RPR)),
+            )
+        self.resolved = {}
+
+    def _flatten(self, style_id):
+        """(alignment, run properties) of style_id and the styles it is based on."""
+        if style_id not in self.resolved:
+            jc, values = None, {}
+            if style_id in self.styles:
+                based_on, own_jc, own = self.styles[style_id]
+                self.resolved[style_id] = (None, {})  # guards against basedOn cycles
+                if based_on:
+                    jc, values = self._flatten(based_on)
+                jc = own_jc or jc
+                values = {**values, **own}
+            self.resolved[style_id] = (jc, values)
+        return self.resolved[style_id]
+
+    def paragraph(self, style_id):
+        jc, values = self._flatten(style_id)
+        return jc, {**self.defaults, **values}
+
+    def character(self, style_id):
+        return self._flatten(style_id)[1]
+
+
+def read_paragraph(p, styles=None):
+    """The Paragraph for a w:p; neighbouring runs of the same format are merged.
+
+    With a StyleSheet the paragraph and character styles are replaced by
+    the alignment and run properties they resolve to.
+    """
+    style_id, jc = 'Normal', None
+    props = p.find(W_PPR)
+    if props is not None:
+        pstyle = props.find(W_PSTYLE)
+        if pstyle is not None:
+            style_id = pstyle.get(W_VAL)
+        align = props.find(W_JC)
+        if align is not None:
+            jc = align.get(W_VAL)
+
+    if styles:
+        style_jc, base = styles.paragraph(style_id)
+        style = jc or style_jc or 'left'
+    else:
+        style = f"{style_id} {jc}" if jc else style_id
+
+    parts = []
+    spans = []
+    length = 0
+    for r in p.iter(W_R):
+        values = run_props(r.find(W_RPR))
+        if styles:
+            rstyle = values.pop('rStyle', None)
+            values = {**base, **styles.character(rstyle), **values} if rstyle else {**base, **values}
+        fmt = run_format(values)
+        start = length
+        for child in r:
+            if child.tag not in RUN_TEXT:
+                continue
+            text = RUN_TEXT[child.tag]
+            if text is None:
+                text = child.text or ''
+            elif child.tag == W_BR and child.get(W_TYPE) == 'page':
+                text = '\f'
+            parts.append(text)
+            length += len(text)
+        if length == start:
+            continue
+        if spans and spans[-1][2] == fmt:
+            spans[-1] = (spans[-1][0], length, fmt)
+        else:
+            spans.append((start, length, fmt))
+    return Paragraph(style, ''.join(parts), tuple(spans))
+
+
+def iter_docx_structure(filepath, resolve_styles=False):
+    """Paragraph tuples for every body paragraph of a .docx, tables included."""
+    styles = StyleSheet(filepath) if resolve_styles else None
+    for p in iter_body_paragraphs(filepath, tables=True):
+        yield read_paragraph(p, styles)
+
+
+# ================= REFERENCES =================
+def verse_range(paragraph):
+    """(chapter, first, last) for a verse paragraph; chapter is None unless it opens one."""
+    text, spans = paragraph.text, paragraph.spans
+    marks = VERSE_MARK.findall(text)
+    if not marks or not text.startswith(marks[0]):
+        return None
+    if len(spans) > 1 and spans[0][1] == len(marks[0]):
+        # the chapter number is a run of its own in place of verse 1
+        return marks[0], 1, int(marks[-1]) if len(marks) > 1 else 1
+    return None, int(marks[0]), int(marks[-1])
+
+
+def book_name(text):
+    """The book a title ("GENESIS") or marker ("--- Genesis ---") paragraph opens, or None."""
+    marker = BOOK_MARKER.fullmatch(text)
+    return BOOK_NAMES.get(marker.group(1).upper() if marker else text)
+
+
+def locate(paragraphs):
+    """Yield (reference, paragraph) for a document's paragraphs, in order.
+
+    References read "Genesis 1:1-2" for verse paragraphs, "Genesis" and
+    "Genesis title" for a book's name and descriptor, "Genesis 2" for a
+    chapter-number paragraph, "Genesis 1:3 heading 1" for the first
+    heading before 1:3 and "front 4" for the paragraphs ahead of the
+    first book. Headings are held back until the verse after them shows
+    which chapter they open; past HELD_PARAGRAPHS of them (a layout whose
+    books or verses aren't recognised) they go out as "Genesis 3
+    unlocated 1" and so on, so memory stays bounded.
+    """
+    book = None
+    chapter = None
+    front = 0
+    pending = []
+
+    def flush(position, label='heading'):
+        nonlocal front
+        for n, held in enumerate(pending, 1):
+            if book:
+                yield f"{position} {label} {n}", held
+            else:
+                front += 1
+                yield f"front {front}", held
+        pending.clear()
+
+    for paragraph in paragraphs:
+        name = book_name(paragraph.text)
+        if name:
+            descriptor = pending.pop() if pending and pending[-1].text == BOOK_TITLES[name] else None
+            yield from flush(f"{book} end")
+            book, chapter = name, None
+            if descriptor:
+                yield f"{book} title", descriptor
+            yield book, paragraph
+            continue
+
+        if book and CHAPTER_NUMBER.fullmatch(paragraph.text):
+            chapter = int(paragraph.text)
+            yield from flush(f"{book} {chapter}")
+            yield f"{book} {chapter}", paragraph
+            continue
+
+        verses = verse_range(paragraph) if book else None
+        if verses is None:
+            pending.append(paragraph)
+            if len(pending) == HELD_PARAGRAPHS:
+                yield from flush(f"{book} {chapter}" if chapter else book, 'unlocated')
+            continue
+
+        if verses[0]:
+            chapter = verses[0]
+        first, last = verses[1], verses[2]
+        yield from flush(f"{book} {chapter}:{first}")
+        if last != first:
+            yield f"{book} {chapter}:{first}-{last}", paragraph
+        else:
+            yield f"{book} {chapter}:{first}", paragraph
+
+    yield from flush(f"{book} end")
+
+
+# ================= DIFF =================
+def describe_format(fmt):
+    return ','.join(f"{name}={value}" if value else name for name, value in fmt) or 'plain'
+
+
+def excerpt(text, start):
+    end = start + CONTEXT
+    return ('...' if start > CONTEXT else '') + repr(text[max(0, start - CONTEXT):end]) + \
+        ('...' if end < len(text) else '')
+
+
+def describe_change(a, b):
+    """What differs between two paragraphs at the same reference, most visible first."""
+    if a.text != b.text:
+        at = next((i for i, (x, y) in enumerate(zip(a.text, b.text)) if x != y),
+                  min(len(a.text), len(b.text)))
+        return f"text differs at {at}: {excerpt(a.text, at)} -> {excerpt(b.text, at)}"
+    if a.style != b.style:
+        return f"style {a.style} -> {b.style}"
+    at = 0
+    for x, y in zip(a.spans, b.spans):
+        if x != y:
+            at = x[0] if x[2] != y[2] else min(x[1], y[1])
+            break
+    fmt_a, stop_a = format_at(a.spans, at)
+    fmt_b, stop_b = format_at(b.spans, at)
+    span = a.text[at:min(stop_a, stop_b)]
+    shown = repr(span[:CONTEXT]) + ('...' if len(span) > CONTEXT else '')
+    return f"format of {shown} at {at}: {describe_format(fmt_a)} -> {describe_format(fmt_b)}"
+
+
+def format_at(spans, at):
+    """(format, stop) of the span covering position at."""
+    for start, stop, fmt in spans:
+        if start <= at < stop:
+            return fmt, stop
+    return (), at
+
+
+def fill(buffer, items):
+    buffer.extend(islice(items, WINDOW - len(buffer)))
+
+
+def find(buffer, text):
+    for i, (_, item) in enumerate(buffer):
+        if item.text == text:
+            return i
+    return None
+
+
+def diff_documents(old_file, new_file, text_only=False, resolve_styles=False):
+    """Yield (reference, kind, detail) for each difference between two .docx files.
+
+    kind is 'changed', 'removed' (only in old_file) or 'added' (only in
+    new_file). Both documents are read as streams; when the text of two
+    paragraphs differs, the next WINDOW paragraphs of each are searched
+    for the text where they agree again (even at the same reference, as
+    headings and blank paragraphs share one), so memory stays bounded by
+    the window. Paragraphs with the same text but another style or
+    formatting are reported as changed where they are.
+    resolve_styles compares the formatting the styles resolve to.
+    """
+    key = (lambda p: p.text) if text_only else (lambda p: p)
+    old = locate(iter_docx_structure(old_file, resolve_styles))
+    new = locate(iter_docx_structure(new_file, resolve_styles))
+    a, b = deque(), deque()
+
+    while True:
+        fill(a, old)
+        fill(b, new)
+        if not a or not b:
+            break
+        (ref_a, pa), (ref_b, pb) = a[0], b[0]
+        if key(pa) == key(pb):
+            a.popleft()
+            b.popleft()
+            continue
+
+        if pa.text != pb.text:
+            i = find(a, pb.text)
+            j = find(b, pa.text)
+            if i is not None and (j is None or i <= j):
+                for _ in range(i):
+                    ref, p = a.popleft()
+                    yield ref, 'removed', excerpt(p.text, 0)
+                continue
+            if j is not None:
+                for _ in range(j):
+                    ref, p = b.popleft()
+                    yield ref, 'added', excerpt(p.text, 0)
+                continue
+
+        a.popleft()
+        b.popleft()
+        if text_only:
+            pa, pb = pa._replace(style='', spans=()), pb._replace(style='', spans=())
+        ref = ref_a if ref_a == ref_b else f"{ref_a} / {ref_b}"
+        yield ref, 'changed', describe_change(pa, pb)
+
+    for ref, p in a:
+        yield ref, 'removed', excerpt(p.text, 0)
+    for ref, p in old:
+        yield ref, 'removed', excerpt(p.text, 0)
+    for ref, p in b:
+        yield ref, 'added', excerpt(p.text, 0)
+    for ref, p in new:
+        yield ref, 'added', excerpt(p.text, 0)
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two built .docx files paragraph by paragraph.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--text-only", action="store_true",
+                        help="ignore paragraph styles and run formatting")
+    parser.add_argument("--resolve-styles", action="store_true",
+                        help="compare the formatting styles amount to, not the style names")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many differences")
+    parser.add_argument("--quiet", action="store_true", help="only print the number of differences")
+    args = parser.parse_args()
+
+    count = 0
+    for ref, kind, detail in diff_documents(args.old, args.new, args.text_only, args.resolve_styles):
+        count += 1
+        if not args.quiet:
+            print(f"{ref}: {kind} {detail}")
+        if args.limit and count >= args.limit:
+            break
+    print(f"{count} difference{'' if count == 1 else 's'}" + (" (stopped at --limit)" if args.limit and count >= args.limit else ""))
+    sys.exit(1 if count else 0)
@@ -0,0 +1,132 @@
+import sys
+import zipfile
+from xml.etree import ElementTree
+
+# Reads the body text of kjv.docx straight from word/document.xml, so the
+# pipeline no longer needs a kjv_source.txt exported by hand from Word.
+# Elements are parsed incrementally and dropped once their paragraph has
+# been emitted, which keeps memory flat however large the document is.
+# Runs keep their italic formatting, so the pipeline can carry it on.
+
+DOCX_EXT = ".docx"
+DOCUMENT_PART = "word/document.xml"
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY = W + 'body'
+W_TBL = W + 'tbl'
+W_P = W + 'p'
+W_R = W + 'r'
+W_RPR = W + 'rPr'
+W_I = W + 'i'
+W_VANISH = W + 'vanish'
+W_VAL = W + 'val'
+# Run content that contributes text, as Word's plain text export writes it
+RUN_TEXT = {W + 't': None, W + 'tab': '\t', W + 'br': '\n', W + 'cr': '\n'}
+OFF = ('0', 'false', 'off')
+
+
+def is_on(props, tag):
+    """Whether a toggle property such as <w:i/> is set in a run's rPr."""
+    if props is None:
+        return False
+    toggle = props.find(tag)
+    return toggle is not None and toggle.get(W_VAL) not in OFF
+
+
+def paragraph_runs(p):
+    """[(text, italic)] for a w:p, neighbouring runs of the same format merged."""
+    runs = []
+    for r in p.iter(W_R):
+        props = r.find(W_RPR)
+        if is_on(props, W_VANISH):
+            continue
+        parts = []
+        for child in r:
+            if child.tag in RUN_TEXT:
+                text = RUN_TEXT[child.tag]
+                parts.append(child.text or '' if text is None else text)
+        text = ''.join(parts)
+        if not text:
+            continue
+        italic = is_on(props, W_I)
+        if runs and runs[-1][1] == italic:
+            runs[-1] = (runs[-1][0] + text, italic)
+        else:
+            runs.append((text, italic))
+    return runs
+
+
+def iter_body_paragraphs(filepath, tables=False):
+    """Yield the w:p elements of a .docx's body, in document order.
+
+    Each element is only complete until the next one is requested; the
+    parsed tree is cleared behind it. Paragraphs inside tables (the title
+    block and the book list of kjv.docx) are skipped unless tables=True,
+    as they were in the text export the pipeline was built against.
+    """
+    with zipfile.ZipFile(filepath) as zf, zf.open(DOCUMENT_PART) as f:
+        body = None
+        table_depth = 0
+        for event, el in ElementTree.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if el.tag == W_BODY:
+                    body = el
+                elif el.tag == W_TBL:
+                    table_depth += 1
+                continue
+
+            if el.tag == W_P:
+                if tables or not table_depth:
+                    yield el
+            elif el.tag == W_TBL:
+                table_depth -= 1
+            else:
+                continue
+
+            # a finished top-level paragraph or table is no longer needed
+            if not table_depth and body is not None:
+                body.clear()
+
+
+def iter_docx_paragraphs(filepath, tables=False):
+    """Yield [(text, italic)] for each body paragraph of a .docx, in document order."""
+    for p in iter_body_paragraphs(filepath, tables):
+        yield paragraph_runs(p)
+
+
+def end_line(line):
+    """line's runs as a tuple, closed by the newline of a plain text export."""
+    if line and not line[-1][1]:
+        return tuple(line[:-1]) + ((line[-1][0] + '\n', False),)
+    return tuple(line) + (('\n', False),)
+
+
+def iter_docx_run_lines(filepath):
+    """Lines of a .docx's body as ((text, italic), ...), split where iter_docx_lines splits them."""
+    for runs in iter_docx_paragraphs(filepath):
+        line = []
+        for text, italic in runs:
+            *ended, rest = text.split('\n')
+            for part in ended:
+                if part:
+                    line.append((part, italic))
+                yield end_line(line)
+                line = []
+            if rest:
+                line.append((rest, italic))
+        yield end_line(line)
+
+
+def iter_docx_lines(filepath):
+    """Lines of a .docx's body text, the same as saving it from Word as plain text."""
+    for line in iter_docx_run_lines(filepath):
+        yield ''.join(text for text, _ in line)
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    # Write the text export the old pipeline needed: python kjv_docx_source.py kjv.docx kjv_source.txt
+    input_file = sys.argv[1] if len(sys.argv) > 1 else "kjv" + DOCX_EXT
+    output_file = sys.argv[2] if len(sys.argv) > 2 else "kjv_source.txt"
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.writelines(iter_docx_lines(input_file))
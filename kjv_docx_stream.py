@@ -0,0 +1,295 @@
+import functools
+import io
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+from docx import Document
+
+from kjv_pipeline import (
+    BOOK_TITLES, CHAPTER_FONT_SIZE, BOOK_DESCRIPTOR_SIZE, BOOK_NAME_SIZE,
+    SECTION_HEADING_SIZE, VERSE_STYLE, CHAPTER_STYLE, HEADING_STYLE,
+    DESCRIPTOR_STYLE, BOOK_NAME_STYLE, ITALIC_STYLE,
+    CUSTOM_ORDER, RunBuilder, add_base_style, add_front_matter, add_styles, iter_blocks,
+    iter_reordered_lines,
+)
+from kjv_metrics import phase, timed
+
+# Writes word/document.xml straight into the zip as blocks come out of
+# iter_blocks, instead of growing a python-docx tree until doc.save.
+# Every paragraph is serialized the way python-docx would serialize it,
+# so the result matches render_docx part for part.
+
+DOCUMENT_PART = 'word/document.xml'
+
+# ================= RUN PROPERTIES =================
+def half_points(length):
+    return int(length.pt * 2)
+
+
+def rpr(bold=False, italic=False, color=None, size=None):
+    """Build a w:rPr in schema order (rFonts, b, i, color, sz)."""
+    xml = '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman"/>'
+    if bold:
+        xml += '<w:b/>'
+    if italic:
+        xml += '<w:i/>'
+    if color:
+        xml += f'<w:color w:val="{color}"/>'
+    if size:
+        xml += f'<w:sz w:val="{size}"/>'
+    return f'<w:rPr>{xml}</w:rPr>'
+
+
+VERSE_RPR = rpr()
+VERSE_ITALIC_RPR = rpr(italic=True)
+HEADING_RPR = rpr(bold=True, size=half_points(SECTION_HEADING_SIZE))
+HEADING_ITALIC_RPR = rpr(bold=True, italic=True, size=half_points(SECTION_HEADING_SIZE))
+CHAPTER_RPR = rpr(bold=True, size=half_points(CHAPTER_FONT_SIZE))
+DESCRIPTOR_RPR = rpr(size=half_points(BOOK_DESCRIPTOR_SIZE))
+BOOK_NAME_RPR = rpr(bold=True, color='000000', size=half_points(BOOK_NAME_SIZE))
+
+CENTER_PPR = '<w:pPr><w:jc w:val="center"/></w:pPr>'
+HEADING1_PPR = '<w:pPr><w:pStyle w:val="Heading1"/><w:jc w:val="center"/></w:pPr>'
+
+# ================= STYLE REFERENCES =================
+def ppr_style(style_id):
+    return f'<w:pPr><w:pStyle w:val="{style_id}"/></w:pPr>'
+
+
+def rpr_style(style_id):
+    return f'<w:rPr><w:rStyle w:val="{style_id}"/></w:rPr>'
+
+
+VERSE_PPR = ppr_style(VERSE_STYLE)
+HEADING_PPR = ppr_style(HEADING_STYLE)
+DESCRIPTOR_PPR = ppr_style(DESCRIPTOR_STYLE)
+BOOK_NAME_PPR = ppr_style(BOOK_NAME_STYLE)
+CHAPTER_STYLE_RPR = rpr_style(CHAPTER_STYLE)
+ITALIC_STYLE_RPR = rpr_style(ITALIC_STYLE)
+
+RUN_BREAKS = re.compile(r'([\t\r\n])')
+
+
+# ================= XML =================
+def run_content(text):
+    """Same element sequence as python-docx's run.text setter."""
+    xml = []
+    for part in RUN_BREAKS.split(text):
+        if not part:
+            continue
+        if part == '\t':
+            xml.append('<w:tab/>')
+        elif part in '\r\n':
+            xml.append('<w:br/>')
+        elif len(part.strip()) < len(part):
+            xml.append(f'<w:t xml:space="preserve">{escape(part)}</w:t>')
+        else:
+            xml.append(f'<w:t>{escape(part)}</w:t>')
+    return ''.join(xml)
+
+
+def run_xml(text, props):
+    return f'<w:r>{props}{run_content(text)}</w:r>'
+
+
+def italics_xml(segments, props, italic_props, runs):
+    """XML counterpart of add_text_with_italics."""
+    xml = []
+    for part, italic in runs.segments(segments):
+        xml.append(run_xml(part, italic_props if italic else props))
+    return ''.join(xml)
+
+
+def block_xml(block, runs):
+    """Serialize one iter_blocks block to its w:p elements."""
+    kind = block[0]
+
+    if kind == 'book':
+        book = block[1]
+        descriptor = BOOK_TITLES[book]
+        xml = ''
+        if descriptor:
+            xml += f'<w:p>{CENTER_PPR}{run_xml(descriptor, DESCRIPTOR_RPR)}</w:p>'
+        return xml + f'<w:p>{HEADING1_PPR}{run_xml(book.upper(), BOOK_NAME_RPR)}</w:p>'
+
+    if kind == 'verse':
+        chapter, segments = block[1], block[2]
+        xml = run_xml(chapter, CHAPTER_RPR) if chapter else ''
+        return f'<w:p>{xml}{italics_xml(segments, VERSE_RPR, VERSE_ITALIC_RPR, runs)}</w:p>'
+
+    return f'<w:p>{italics_xml(block[1], HEADING_RPR, HEADING_ITALIC_RPR, runs)}</w:p>'
+
+
+def styled_block_xml(block, runs):
+    """Serialize one block with style references instead of direct formatting."""
+    kind = block[0]
+
+    if kind == 'book':
+        book = block[1]
+        descriptor = BOOK_TITLES[book]
+        xml = ''
+        if descriptor:
+            xml += f'<w:p>{DESCRIPTOR_PPR}{run_xml(descriptor, "")}</w:p>'
+        return xml + f'<w:p>{BOOK_NAME_PPR}{run_xml(book.upper(), "")}</w:p>'
+
+    if kind == 'verse':
+        chapter, segments = block[1], block[2]
+        xml = run_xml(chapter, CHAPTER_STYLE_RPR) if chapter else ''
+        return f'<w:p>{VERSE_PPR}{xml}{italics_xml(segments, "", ITALIC_STYLE_RPR, runs)}</w:p>'
+
+    return f'<w:p>{HEADING_PPR}{italics_xml(block[1], "", ITALIC_STYLE_RPR, runs)}</w:p>'
+
+
+# ================= WRITER =================
+def skeleton_package(styled=True, front_matter=True):
+    """A document holding only the front matter, as a zip in a BytesIO.
+
+    front_matter=False leaves out the cover, contents and introduction
+    but keeps the base style. Built once per process and setting.
+    """
+    return io.BytesIO(skeleton_bytes(styled, front_matter))
+
+
+@functools.lru_cache(maxsize=None)
+def skeleton_bytes(styled, front_matter):
+    doc = Document()
+    if front_matter:
+        add_front_matter(doc)
+    else:
+        add_base_style(doc)
+    if styled:
+        add_styles(doc)
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+class DocumentWriter:
+    """The skeleton package written out with body XML spliced in as it arrives.
+
+    write() takes one fragment at a time, so a caller that is pushed
+    blocks (kjv_formats) can stream them as well as one that pulls them.
+    Parts are written in the skeleton's order; the ones after
+    document.xml follow once close() has finished it.
+    """
+
+    def __init__(self, output_file, styled=True, front_matter=True):
+        self.src = zipfile.ZipFile(skeleton_package(styled, front_matter))
+        self.dst = zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED)
+        self.items = iter(self.src.infolist())
+        for item in self.items:
+            if item.filename == DOCUMENT_PART:
+                break
+            self.dst.writestr(item, self.src.read(item.filename))
+
+        skeleton_xml = self.src.read(DOCUMENT_PART).decode('utf-8')
+        split = skeleton_xml.rindex('<w:sectPr')
+        self.tail = skeleton_xml[split:]
+        self.out = io.TextIOWrapper(self.dst.open(DOCUMENT_PART, 'w'), encoding='utf-8')
+        self.out.write(skeleton_xml[:split])
+
+    def write(self, xml):
+        self.out.write(xml)
+
+    def close(self):
+        self.out.write(self.tail)
+        self.out.close()
+        for item in self.items:
+            self.dst.writestr(item, self.src.read(item.filename))
+        self.dst.close()
+        self.src.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.out.close()
+            self.dst.close()
+            self.src.close()
+
+
+def write_document(fragments, output_file, styled=True, front_matter=True):
+    """Write the skeleton package with the XML fragments spliced into its body."""
+    with DocumentWriter(output_file, styled, front_matter) as writer:
+        for xml in fragments:
+            writer.write(xml)
+
+
+def write_docx(lines, output_file, styled=True, metrics=None):
+    """Stream the reordered Bible lines into output_file without a python-docx tree.
+
+    Returns the RunBuilder used, like render_docx.
+    """
+    runs = RunBuilder()
+    to_xml = styled_block_xml if styled else block_xml
+    blocks = timed(metrics, iter_blocks(lines, metrics), 'classifying')
+    fragments = timed(metrics, (to_xml(block, runs) for block in blocks), 'building')
+    with phase(metrics, 'saving'):
+        write_document(fragments, output_file, styled)
+    return runs
+
+
+# ================= PER BOOK =================
+def render_book(job):
+    """Worker: serialize one book's body XML; returns (xml, runs, saved)."""
+    book_name, chapters, styled = job
+    runs = RunBuilder()
+    to_xml = styled_block_xml if styled else block_xml
+    lines = iter_reordered_lines({book_name: chapters}, [book_name])
+    xml = ''.join(to_xml(block, runs) for block in iter_blocks(lines))
+    return xml, runs.runs, runs.saved
+
+
+def render_books(jobs, workers=0):
+    """render_book over jobs, in a process pool when workers > 0, in job order."""
+    if workers and jobs:
+        with ProcessPoolExecutor(workers) as pool:
+            yield from pool.map(render_book, jobs)
+    else:
+        yield from map(render_book, jobs)
+
+
+def write_docx_by_book(bible_dict, output_file, order=CUSTOM_ORDER, styled=True,
+                       workers=0, cache=None):
+    """Render book by book and merge the fragments in order.
+
+    Books share no state once they are split at their --- Book --- markers,
+    so they can be rendered in a process pool, and pool.map hands results
+    back in submission order: the merged document.xml is identical to
+    write_docx's for the same order. With a kjv_cache.BookCache only books
+    whose key changed are rendered; the rest are read from it up front, so
+    another build evicting them meanwhile costs nothing.
+    """
+    books = [book for book in order if book in bible_dict]
+    keys = {}
+    cached = {}
+    if cache:
+        keys = {book: cache.key(book, bible_dict[book], styled) for book in books}
+        for book in books:
+            result = cache.get(keys[book])
+            if result is not None:
+                cached[book] = result
+    misses = [(book, bible_dict[book], styled) for book in books if book not in cached]
+    rendered = render_books(misses, workers)
+    runs = RunBuilder()
+
+    def fragments():
+        for book in books:
+            result = cached.pop(book, None)
+            if result is None:
+                result = next(rendered)
+                if cache:
+                    cache.put(keys[book], result)
+            xml, book_runs, book_saved = result
+            runs.runs += book_runs
+            runs.saved += book_saved
+            yield xml
+
+    write_document(fragments(), output_file, styled)
+    if cache:
+        cache.evict()
+    return runs
@@ -0,0 +1,367 @@
+import io
+import json
+import os
+import time
+import uuid
+import zipfile
+from xml.sax.saxutils import escape
+
+from kjv_docx_stream import DocumentWriter, block_xml, styled_block_xml
+from kjv_metrics import phase, timed
+from kjv_pipeline import (
+    BOOK_TITLES, CONTENTS_TITLE, COVER_TEXT, INTRODUCTION, INTRODUCTION_TITLE, RunBuilder, iter_blocks,
+    plain_text,
+)
+
+# One classified block stream, several outputs. iter_blocks runs once and
+# every block is handed to each renderer in turn, so adding a format costs
+# its own serialization and nothing else:
+#
+#   python kjv_pipeline.py kjv.docx KJV.docx --formats docx,epub,html,jsonl,txt
+#
+# writes KJV.docx, KJV.epub, KJV.html, KJV.jsonl and KJV.txt in one pass.
+
+TITLE = "The Holy Bible"
+SUBTITLE = "King James Version"
+
+# the sizes of add_styles, for the HTML and EPUB stylesheet
+CSS = """body { font-family: "Times New Roman", serif; font-size: 11pt; }
+header.cover { text-align: center; margin: 30% 0; }
+p.title { font-size: 36pt; font-weight: bold; margin: 0; }
+p.subtitle { font-size: 18pt; margin: 0; }
+p.descriptor { text-align: center; font-size: 14pt; margin-bottom: 0; }
+h1 { text-align: center; font-size: 26pt; margin-top: 0; }
+h2 { font-size: 12.5pt; margin-bottom: 0.2em; }
+span.chapter { font-weight: bold; font-size: 20pt; }
+"""
+
+
+# ================= RENDERERS =================
+class Renderer:
+    """One output format, fed iter_blocks(..., chapters=True) blocks one at a time.
+
+    Subclasses write the file as blocks arrive and finish it in close().
+    book, chapter and runs are kept up to date for them. front_matter=False
+    leaves out the cover, contents and introduction, or what a format has
+    of them.
+    """
+
+    ext = None
+
+    def __init__(self, output_file, styled=True, front_matter=True):
+        self.output_file = output_file
+        self.styled = styled
+        self.front_matter = front_matter
+        self.runs = RunBuilder()
+        self.book = None
+        self.chapter = None
+
+    def block(self, block):
+        kind = block[0]
+        if kind == 'book':
+            self.book, self.chapter = block[1], None
+            self.book_title(block[1])
+        elif kind == 'chapter':
+            self.chapter = int(block[1])
+            self.chapter_marker(self.chapter)
+        elif kind == 'verse':
+            self.verse(block[1], self.runs.segments(block[2]))
+        else:
+            self.heading(self.runs.segments(block[1]))
+
+    def book_title(self, book):
+        pass
+
+    def chapter_marker(self, chapter):
+        pass
+
+    def verse(self, chapter, segments):
+        pass
+
+    def heading(self, segments):
+        pass
+
+    def close(self):
+        pass
+
+
+class DocxRenderer(Renderer):
+    """The streaming kjv_docx_stream document, identical to write_docx's."""
+
+    ext = ".docx"
+
+    def __init__(self, output_file, styled=True, front_matter=True):
+        super().__init__(output_file, styled, front_matter)
+        self.writer = DocumentWriter(output_file, styled, front_matter)
+        self.to_xml = styled_block_xml if styled else block_xml
+
+    def block(self, block):
+        if block[0] != 'chapter':
+            self.writer.write(self.to_xml(block, self.runs))
+
+    def close(self):
+        self.writer.close()
+
+
+class TextRenderer(Renderer):
+    """Plain text, one paragraph per line, as Word's plain text export of the DOCX reads.
+
+    The front matter is the text of its cover, contents title and
+    introduction; the contents themselves are a field Word fills in.
+    """
+
+    ext = ".txt"
+
+    def __init__(self, output_file, styled=True, front_matter=True):
+        super().__init__(output_file, styled, front_matter)
+        self.out = open(output_file, 'w', encoding='utf-8')
+        if front_matter:
+            for text in (COVER_TEXT, CONTENTS_TITLE, f"{INTRODUCTION_TITLE}\n\n{INTRODUCTION}"):
+                self.out.write(text + '\n')
+
+    def book_title(self, book):
+        if BOOK_TITLES[book]:
+            self.out.write(BOOK_TITLES[book] + '\n')
+        self.out.write(book.upper() + '\n')
+
+    def verse(self, chapter, segments):
+        self.out.write((chapter or '') + plain_text(segments) + '\n')
+
+    def heading(self, segments):
+        self.out.write(plain_text(segments) + '\n')
+
+    def close(self):
+        self.out.close()
+
+
+class JsonLinesRenderer(Renderer):
+    """One JSON object per block, with italics as [start, stop] offsets into text.
+
+    The front matter is a first "front" record with the title, subtitle
+    and introduction.
+    """
+
+    ext = ".jsonl"
+
+    def __init__(self, output_file, styled=True, front_matter=True):
+        super().__init__(output_file, styled, front_matter)
+        self.out = open(output_file, 'w', encoding='utf-8')
+        if front_matter:
+            self.record(type='front', title=TITLE, subtitle=SUBTITLE, introduction=INTRODUCTION)
+
+    def record(self, **fields):
+        self.out.write(json.dumps(fields, ensure_ascii=False) + '\n')
+
+    def text_fields(self, segments):
+        italic = []
+        pos = 0
+        for text, is_italic in segments:
+            if is_italic:
+                italic.append([pos, pos + len(text)])
+            pos += len(text)
+        return {'text': plain_text(segments), 'italic': italic}
+
+    def book_title(self, book):
+        self.record(type='book', book=book, descriptor=BOOK_TITLES[book])
+
+    def chapter_marker(self, chapter):
+        self.record(type='chapter', book=self.book, chapter=chapter)
+
+    def verse(self, chapter, segments):
+        self.record(type='verse', book=self.book, chapter=self.chapter, **self.text_fields(segments))
+
+    def heading(self, segments):
+        self.record(type='heading', book=self.book, chapter=self.chapter, **self.text_fields(segments))
+
+    def close(self):
+        self.out.close()
+
+
+def inline_html(segments):
+    return ''.join(f'<i>{escape(text)}</i>' if italic else escape(text) for text, italic in segments)
+
+
+def book_id(book):
+    return 'book-' + book.lower().replace(' ', '-')
+
+
+COVER_HTML = (f'<header class="cover">\n<p class="title">{TITLE}</p>\n'
+              f'<p class="subtitle">{SUBTITLE}</p>\n</header>')
+
+
+class HtmlRenderer(Renderer):
+    """A single self-contained HTML page.
+
+    The front matter is a cover at the top of the page. Without it the
+    page is titled after its first book, as a shard of one book is.
+    """
+
+    ext = ".html"
+
+    def __init__(self, output_file, styled=True, front_matter=True):
+        super().__init__(output_file, styled, front_matter)
+        self.out = open(output_file, 'w', encoding='utf-8')
+        self.started = False
+
+    def start(self, title):
+        self.started = True
+        self.out.write(
+            '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+            f'<title>{escape(title)}</title>\n<style>\n{CSS}</style>\n</head>\n<body>\n'
+        )
+        if self.front_matter:
+            self.write(COVER_HTML)
+
+    def block(self, block):
+        if not self.started:
+            self.start(f"{TITLE}: {SUBTITLE}" if self.front_matter or block[0] != 'book' else block[1])
+        super().block(block)
+
+    def write(self, html):
+        self.out.write(html + '\n')
+
+    def book_title(self, book):
+        if BOOK_TITLES[book]:
+            self.write(f'<p class="descriptor">{escape(BOOK_TITLES[book])}</p>')
+        self.write(f'<h1 id="{book_id(book)}">{escape(book.upper())}</h1>')
+
+    def verse(self, chapter, segments):
+        number = f'<span class="chapter">{chapter}</span>' if chapter else ''
+        self.write(f'<p>{number}{inline_html(segments)}</p>')
+
+    def heading(self, segments):
+        self.write(f'<h2>{inline_html(segments)}</h2>')
+
+    def close(self):
+        if not self.started:
+            self.start(f"{TITLE}: {SUBTITLE}")
+        self.out.write('</body>\n</html>\n')
+        self.out.close()
+
+
+XHTML_HEAD = ('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+              '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" '
+              'xml:lang="en" lang="en">\n<head>\n<meta charset="utf-8"/>\n<title>{title}</title>\n'
+              '<link rel="stylesheet" type="text/css" href="style.css"/>\n</head>\n<body>\n')
+XHTML_TAIL = '</body>\n</html>\n'
+
+CONTAINER_XML = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                 '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+                 '<rootfiles><rootfile full-path="OEBPS/content.opf" '
+                 'media-type="application/oebps-package+xml"/></rootfiles>\n</container>\n')
+
+
+class EpubRenderer(HtmlRenderer):
+    """An EPUB 3 package with one XHTML document per book and a navigation document.
+
+    Each book's document is streamed into the zip while its blocks arrive;
+    the package document and the table of contents follow at the end,
+    once every book is known. The front matter is a cover document and
+    the table of contents read in the spine after it; without it the
+    contents are only there for the reading system's navigation.
+    """
+
+    ext = ".epub"
+    block = Renderer.block
+
+    def __init__(self, output_file, styled=True, front_matter=True):
+        Renderer.__init__(self, output_file, styled, front_matter)
+        self.zip = zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED)
+        # the mimetype must come first and uncompressed
+        self.zip.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip', zipfile.ZIP_STORED)
+        self.zip.writestr('META-INF/container.xml', CONTAINER_XML)
+        self.zip.writestr('OEBPS/style.css', CSS)
+        self.documents = []
+        self.out = None
+        if front_matter:
+            self.open_document(TITLE)
+            self.write(COVER_HTML)
+
+    def open_document(self, title):
+        self.close_document()
+        name = f"text-{len(self.documents) + 1:02}.xhtml"
+        self.documents.append((name, title))
+        self.out = open_text(self.zip, 'OEBPS/' + name)
+        self.out.write(XHTML_HEAD.format(title=escape(title)))
+
+    def close_document(self):
+        if self.out:
+            self.out.write(XHTML_TAIL)
+            self.out.close()
+            self.out = None
+
+    def write(self, html):
+        if not self.out:
+            self.open_document(TITLE)
+        self.out.write(html + '\n')
+
+    def book_title(self, book):
+        self.open_document(book)
+        super().book_title(book)
+
+    def close(self):
+        self.close_document()
+        nav = ''.join(f'<li><a href="{name}">{escape(title)}</a></li>\n' for name, title in self.documents)
+        self.zip.writestr('OEBPS/nav.xhtml', XHTML_HEAD.format(title='Contents') +
+                          f'<nav epub:type="toc" id="toc">\n<h1>Contents</h1>\n<ol>\n{nav}</ol>\n</nav>\n' +
+                          XHTML_TAIL)
+
+        identifier = uuid.uuid5(uuid.NAMESPACE_URL, f"kjv:{os.path.basename(self.output_file)}")
+        modified = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        manifest = ''.join(f'<item id="t{i}" href="{name}" media-type="application/xhtml+xml"/>\n'
+                           for i, (name, _) in enumerate(self.documents, 1))
+        spine_ids = [f"t{i}" for i in range(1, len(self.documents) + 1)]
+        if self.front_matter:
+            spine_ids.insert(1, 'nav')
+        spine = ''.join(f'<itemref idref="{item}"/>\n' for item in spine_ids)
+        title = f"{TITLE}: {SUBTITLE}" if self.front_matter or not self.documents else self.documents[0][1]
+        self.zip.writestr('OEBPS/content.opf', (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">\n'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+            f'<dc:identifier id="uid">urn:uuid:{identifier}</dc:identifier>\n'
+            f'<dc:title>{escape(title)}</dc:title>\n<dc:language>en</dc:language>\n'
+            f'<meta property="dcterms:modified">{modified}</meta>\n</metadata>\n'
+            '<manifest>\n<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n'
+            '<item id="css" href="style.css" media-type="text/css"/>\n'
+            f'{manifest}</manifest>\n<spine>\n{spine}</spine>\n</package>\n'
+        ))
+        self.zip.close()
+
+
+def open_text(zf, name):
+    """A text stream writing a new zip member."""
+    return io.TextIOWrapper(zf.open(name, 'w'), encoding='utf-8')
+
+
+FORMATS = {
+    'docx': DocxRenderer,
+    'epub': EpubRenderer,
+    'html': HtmlRenderer,
+    'jsonl': JsonLinesRenderer,
+    'txt': TextRenderer,
+}
+
+
+def format_path(output_file, fmt):
+    """output_file with the extension of fmt in place of its own."""
+    return os.path.splitext(output_file)[0] + FORMATS[fmt].ext
+
+
+# ================= FAN-OUT =================
+def render_formats(lines, output_file, formats, styled=True, metrics=None):
+    """Classify lines once and render every format in formats from the same blocks.
+
+    Each format goes to format_path(output_file, fmt). Returns the
+    renderers, closed, in the order of formats.
+    """
+    renderers = [FORMATS[fmt](format_path(output_file, fmt), styled) for fmt in formats]
+    blocks = timed(metrics, iter_blocks(lines, metrics, chapters=True), 'classifying')
+    with phase(metrics, 'building'):
+        for block in blocks:
+            for renderer in renderers:
+                renderer.block(block)
+    with phase(metrics, 'saving'):
+        for renderer in renderers:
+            renderer.close()
+    return renderers
@@ -0,0 +1,127 @@
+import sys
+
+from kjv_corpus import CORPUS_EXT, Corpus
+from kjv_pipeline import iter_normalized_lines, standardize_book_name
+from kjv_refs import ReferenceParser
+
+# Verse lookups against a Corpus without scanning the text. Each chapter
+# is already a contiguous run of verse rows, so the index only needs to
+# know where that run starts and which verse number it starts with.
+# References are read by kjv_refs, the same as in study note imports.
+
+
+class VerseIndex:
+    """(book, chapter, verse) -> verse row in O(1), ranges as one row slice.
+
+    Book names go through standardize_book_name, so BOOK_NAME_MAP
+    abbreviations work as well as the canonical names.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.parser = ReferenceParser()
+        # (book id, chapter) -> (first row, stop row, first verse number) when
+        # the chapter's verses are numbered consecutively, else a dict of rows
+        self.chapters = {}
+
+        numbers = corpus.verse_number
+        for book_id, chapters in corpus.chapter_index.items():
+            for chapter, row in chapters.items():
+                rows = corpus.verse_rows(row)
+                if not rows:
+                    continue
+                first = numbers[rows.start]
+                if all(numbers[r] == first + i for i, r in enumerate(rows)):
+                    self.chapters[book_id, chapter] = (rows.start, rows.stop, first)
+                else:
+                    by_number = {}
+                    for r in rows:
+                        by_number.setdefault(numbers[r], r)
+                    self.chapters[book_id, chapter] = by_number
+
+    def book_id(self, book):
+        book_id = self.corpus.book_ids.get(standardize_book_name(book))
+        if book_id is None:
+            raise KeyError(book)
+        return book_id
+
+    def row(self, book, chapter, verse):
+        """Verse row of book chapter:verse; KeyError if there is no such verse."""
+        entry = self.chapters[self.book_id(book), chapter]
+        if isinstance(entry, dict):
+            return entry[verse]
+        start, stop, first = entry
+        row = start + verse - first
+        if not start <= row < stop:
+            raise KeyError((book, chapter, verse))
+        return row
+
+    def rows(self, book, chapter, first=None, last=None):
+        """Verse rows of a whole chapter, or of verses first..last, as a range."""
+        entry = self.chapters[self.book_id(book), chapter]
+        if isinstance(entry, dict):
+            numbers = sorted(entry)
+            first = numbers[0] if first is None else first
+            last = numbers[-1] if last is None else last
+            wanted = [entry[n] for n in numbers if first <= n <= last]
+            if not wanted:
+                raise KeyError((book, chapter, first, last))
+            return range(wanted[0], wanted[-1] + 1)
+
+        start, stop, first_verse = entry
+        lo = start if first is None else max(start, start + first - first_verse)
+        hi = stop if last is None else min(stop, start + last - first_verse + 1)
+        if lo >= hi:
+            raise KeyError((book, chapter, first, last))
+        return range(lo, hi)
+
+    def verse(self, book, chapter, verse):
+        return self.corpus.verse_text(self.row(book, chapter, verse))
+
+    def passage(self, book, chapter, first=None, last=None):
+        """[(verse number, text)] for a chapter or a verse range of it."""
+        corpus = self.corpus
+        return [(corpus.verse_number[r], corpus.verse_text(r))
+                for r in self.rows(book, chapter, first, last)]
+
+    def lookup(self, reference):
+        """Resolve 'John 3:16', 'Romans 8:28-39', 'Psalms 23' or 'Jude 3' to a passage.
+
+        Anything kjv_refs parses works, lists and cross-chapter ranges
+        included; their verses come back one after the other.
+        """
+        passage = []
+        for ref in self.parser.parse(reference):
+            passage += self.passage(ref.book, ref.chapter, ref.first, ref.last)
+        return passage
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    # python kjv_index.py kjv.kjvc "John 3:16" "Romans 8:28-39"
+    if len(sys.argv) < 3:
+        raise SystemExit("usage: python kjv_index.py SOURCE REFERENCE...")
+    source = sys.argv[1]
+    if source.endswith(CORPUS_EXT):
+        corpus = Corpus.load(source)
+    else:
+        corpus = Corpus.from_lines(iter_normalized_lines(source))
+    index = VerseIndex(corpus)
+
+    failed = 0
+    for reference in sys.argv[2:]:
+        try:
+            passage = index.lookup(reference)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        except KeyError:
+            print(f"error: no such book or passage: {reference!r}", file=sys.stderr)
+            failed += 1
+            continue
+        print(reference)
+        for number, text in passage:
+            print(f"{number} {text}")
+        print()
+    sys.exit(1 if failed else 0)
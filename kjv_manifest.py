@@ -0,0 +1,119 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+from kjv_docx_diff import describe_format, iter_docx_structure, locate
+
+# Per-paragraph fingerprints of a built document, written next to it as
+# KJV_Cleaned_Final.manifest by kjv_pipeline.py --manifest. Every line is
+#
+#   reference <TAB> paragraph hash <TAB> rolling hash
+#
+# with references as kjv_docx_diff.locate() gives them ("Genesis 1:3-5",
+# "Genesis 1:6 heading 1"). The paragraph hash covers the alignment, the
+# text and the formatting the styles resolve to, so a styled build and
+# the stage17 directly formatted one fingerprint the same. The rolling
+# hash chains every paragraph hash before it: equal last lines mean equal
+# documents, and the first unequal line is where they diverged.
+#
+#   python kjv_manifest.py KJV_Cleaned_Final.docx
+#   python kjv_manifest.py --compare reference.manifest KJV_Cleaned_Final.manifest
+
+MANIFEST_EXT = ".manifest"
+MANIFEST_HEADER = "# kjv manifest 1\n"
+DIGEST_SIZE = 8
+
+
+def manifest_path(docx_file):
+    return os.path.splitext(docx_file)[0] + MANIFEST_EXT
+
+
+def paragraph_hash(paragraph):
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    h.update(paragraph.style.encode('utf-8'))
+    h.update(b'\0')
+    h.update(paragraph.text.encode('utf-8'))
+    for start, stop, fmt in paragraph.spans:
+        h.update(f"\0{start}:{stop}:{describe_format(fmt)}".encode('utf-8'))
+    return h.digest()
+
+
+def iter_fingerprints(docx_file):
+    """Yield (reference, paragraph hash, rolling hash) hex strings for a built .docx."""
+    rolling = b''
+    for ref, paragraph in locate(iter_docx_structure(docx_file, resolve_styles=True)):
+        digest = paragraph_hash(paragraph)
+        rolling = hashlib.blake2b(rolling + digest, digest_size=DIGEST_SIZE).digest()
+        yield ref, digest.hex(), rolling.hex()
+
+
+def write_manifest(docx_file, manifest_file=None):
+    """Fingerprint docx_file into manifest_file (default: next to it); returns the path."""
+    manifest_file = manifest_file or manifest_path(docx_file)
+    tmp = manifest_file + '.tmp'
+    with open(tmp, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(MANIFEST_HEADER)
+        for entry in iter_fingerprints(docx_file):
+            f.write('\t'.join(entry) + '\n')
+    os.replace(tmp, manifest_file)
+    return manifest_file
+
+
+def load_manifest(path):
+    """[(reference, paragraph hash, rolling hash)] from a manifest, or from a .docx directly."""
+    if not path.endswith(MANIFEST_EXT):
+        return list(iter_fingerprints(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        if f.readline() != MANIFEST_HEADER:
+            raise ValueError(f"{path} is not a kjv manifest")
+        return [tuple(line.rstrip('\n').split('\t')) for line in f]
+
+
+def compare_manifests(old, new):
+    """[(reference, kind)] where two manifests differ; kind is 'changed', 'removed' or 'added'.
+
+    Identical documents are recognised from the last rolling hash alone.
+    """
+    if old and new and old[-1][2] == new[-1][2] and len(old) == len(new):
+        return []
+    new_hashes = {ref: digest for ref, digest, _ in new}
+    old_refs = set()
+    differences = []
+    for ref, digest, _ in old:
+        old_refs.add(ref)
+        if ref not in new_hashes:
+            differences.append((ref, 'removed'))
+        elif new_hashes[ref] != digest:
+            differences.append((ref, 'changed'))
+    differences.extend((ref, 'added') for ref, _, _ in new if ref not in old_refs)
+    return differences
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write or compare per-paragraph fingerprints of built .docx files.")
+    parser.add_argument("files", nargs="+", metavar="FILE",
+                        help="a .docx to fingerprint, or two manifests (or .docx files) with --compare")
+    parser.add_argument("--compare", action="store_true", help="compare two manifests instead of writing one")
+    parser.add_argument("--output", help="manifest path (default: next to the .docx)")
+    args = parser.parse_args()
+
+    if not args.compare:
+        start = time.perf_counter()
+        for docx_file in args.files:
+            path = write_manifest(docx_file, args.output if len(args.files) == 1 else None)
+            print(f"Wrote {path} in {time.perf_counter() - start:.2f}s")
+        sys.exit(0)
+
+    if len(args.files) != 2:
+        raise SystemExit("--compare takes two files")
+    start = time.perf_counter()
+    old, new = (load_manifest(path) for path in args.files)
+    differences = compare_manifests(old, new)
+    for ref, kind in differences:
+        print(f"{ref}: {kind}")
+    print(f"{len(differences)} paragraph{'' if len(differences) == 1 else 's'} differ "
+          f"({len(old)} vs {len(new)} paragraphs, {time.perf_counter() - start:.3f}s)")
+    sys.exit(1 if differences else 0)
@@ -0,0 +1,105 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+# Opt-in counters and timings for one build (kjv_pipeline.py --metrics).
+# Phases nest: a generator timed as 'classifying' that pulls from one
+# timed as 'reading' only gets charged for its own work, so the phase
+# times add up to the build's wall time even though every stage streams.
+
+LINE_KINDS = ('verse', 'chapter', 'heading', 'book_title', 'junk_stripped', 'skipped')
+PHASES = ('reading', 'classifying', 'building', 'saving')
+
+# classify_segments kinds -> report names
+KIND_NAMES = {'verse': 'verse', 'chapter': 'chapter', 'heading': 'heading',
+              'book': 'book_title', 'spacer': 'skipped'}
+
+
+class BuildMetrics:
+    """Line, paragraph and italic counts plus the time spent in each phase."""
+
+    def __init__(self):
+        self.lines = dict.fromkeys(LINE_KINDS, 0)
+        self.paragraphs = 0
+        self.italic_segments = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self._phases = []
+        self._mark = time.perf_counter()
+        self._started = self._mark
+
+    # ================= COUNTERS =================
+    def count_line(self, kind, junk_stripped=False):
+        self.lines[KIND_NAMES[kind]] += 1
+        if junk_stripped:
+            self.lines['junk_stripped'] += 1
+
+    def count_block(self, paragraphs, segments=()):
+        self.paragraphs += paragraphs
+        self.italic_segments += sum(1 for text, italic in segments if italic and text)
+
+    # ================= TIMING =================
+    def _switch(self):
+        """Charge the time since the last switch to the innermost open phase."""
+        now = time.perf_counter()
+        if self._phases:
+            self.seconds[self._phases[-1]] += now - self._mark
+        self._mark = now
+
+    @contextmanager
+    def phase(self, name):
+        self._switch()
+        self._phases.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self._phases.pop()
+
+    def timed(self, iterable, name):
+        """Yield from iterable, charging the time spent producing each item to name."""
+        items = iter(iterable)
+        phases = self._phases
+        while True:
+            # phase() inlined: this runs once per line
+            self._switch()
+            phases.append(name)
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self._switch()
+                phases.pop()
+            yield item
+
+    # ================= REPORT =================
+    def report(self, runs, **info):
+        """The JSON-ready report; runs is the build's RunBuilder, info goes in as is."""
+        seconds = {name: round(value, 4) for name, value in self.seconds.items()}
+        seconds['total'] = round(time.perf_counter() - self._started, 4)
+        return {
+            **info,
+            'lines': dict(self.lines),
+            'paragraphs': self.paragraphs,
+            'runs': runs.runs,
+            'runs_dropped': runs.saved,
+            'italic_segments': self.italic_segments,
+            'seconds': seconds,
+        }
+
+    def write(self, path, runs, **info):
+        report = self.report(runs, **info)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        return report
+
+
+def phase(metrics, name):
+    """metrics.phase(name), or a no-op when the build isn't measured."""
+    return metrics.phase(name) if metrics else nullcontext()
+
+
+def timed(metrics, iterable, name):
+    """metrics.timed(iterable, name), or iterable itself when the build isn't measured."""
+    return metrics.timed(iterable, name) if metrics else iterable
@@ -0,0 +1,1121 @@
+import argparse
+import os
+import re
+from docx import Document
+from docx.shared import Pt, RGBColor
+from docx.oxml import OxmlElement, ns
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from kjv_docx_source import DOCX_EXT, iter_docx_run_lines
+from kjv_metrics import BuildMetrics, phase, timed
+from process_bible import HOLY_WORD, holy_across, rewrite_segments
+
+# ================= FILES =================
+INPUT_FILE = "kjv_source.txt"
+OUTPUT_FILE = "KJV_Cleaned_Final.docx"
+
+# ================= BOOK ORDER =================
+CUSTOM_ORDER = [
+    "Genesis", "Exodus", "Leviticus", "Numbers", "Deuteronomy",
+    "Joshua", "Judges", "1 Samuel", "2 Samuel", "1 Kings", "2 Kings",
+    "Isaiah", "Jeremiah", "Ezekiel", "Hosea", "Joel", "Amos",
+    "Obadiah", "Jonah", "Micah", "Nahum", "Habakkuk", "Zephaniah",
+    "Haggai", "Zechariah", "Malachi", "Psalms", "Proverbs", "Job",
+    "Song of Solomon", "Ruth", "Lamentations", "Ecclesiastes",
+    "Esther", "Daniel", "Ezra", "Nehemiah", "1 Chronicles", "2 Chronicles",
+    "Matthew", "Mark", "Luke", "John", "Acts", "James", "1 Peter",
+    "2 Peter", "1 John", "2 John", "3 John", "Jude", "Romans",
+    "1 Corinthians", "2 Corinthians", "Galatians", "Ephesians",
+    "Philippians", "Colossians", "1 Thessalonians", "2 Thessalonians",
+    "Hebrews", "1 Timothy", "2 Timothy", "Titus", "Philemon", "Revelation"
+]
+
+CANONICAL_ORDER = [
+    "Genesis", "Exodus", "Leviticus", "Numbers", "Deuteronomy",
+    "Joshua", "Judges", "Ruth", "1 Samuel", "2 Samuel", "1 Kings", "2 Kings",
+    "1 Chronicles", "2 Chronicles", "Ezra", "Nehemiah", "Esther", "Job",
+    "Psalms", "Proverbs", "Ecclesiastes", "Song of Solomon", "Isaiah",
+    "Jeremiah", "Lamentations", "Ezekiel", "Daniel", "Hosea", "Joel", "Amos",
+    "Obadiah", "Jonah", "Micah", "Nahum", "Habakkuk", "Zephaniah",
+    "Haggai", "Zechariah", "Malachi",
+    "Matthew", "Mark", "Luke", "John", "Acts", "Romans",
+    "1 Corinthians", "2 Corinthians", "Galatians", "Ephesians",
+    "Philippians", "Colossians", "1 Thessalonians", "2 Thessalonians",
+    "1 Timothy", "2 Timothy", "Titus", "Philemon", "Hebrews", "James",
+    "1 Peter", "2 Peter", "1 John", "2 John", "3 John", "Jude", "Revelation"
+]
+
+# The Hebrew Bible alone, in the Tanakh's Torah, Nevi'im, Ketuvim order
+TANAKH_ORDER = CUSTOM_ORDER[:CUSTOM_ORDER.index("Matthew")]
+
+# Books placed by the period of the events they tell, or by when they
+# were written where they tell none (the epistles)
+CHRONOLOGICAL_ORDER = [
+    "Genesis", "Job", "Exodus", "Leviticus", "Numbers", "Deuteronomy",
+    "Joshua", "Judges", "Ruth", "1 Samuel", "2 Samuel", "1 Chronicles",
+    "Psalms", "1 Kings", "Proverbs", "Song of Solomon", "Ecclesiastes",
+    "2 Kings", "2 Chronicles", "Obadiah", "Joel", "Jonah", "Amos", "Hosea",
+    "Isaiah", "Micah", "Nahum", "Zephaniah", "Habakkuk", "Jeremiah",
+    "Lamentations", "Ezekiel", "Daniel", "Ezra", "Haggai", "Zechariah",
+    "Esther", "Nehemiah", "Malachi",
+    "Matthew", "Mark", "Luke", "John", "Acts", "James", "Galatians",
+    "1 Thessalonians", "2 Thessalonians", "1 Corinthians", "2 Corinthians",
+    "Romans", "Ephesians", "Philippians", "Colossians", "Philemon",
+    "1 Timothy", "Titus", "1 Peter", "Hebrews", "2 Timothy", "2 Peter",
+    "Jude", "1 John", "2 John", "3 John", "Revelation"
+]
+
+# Named profiles for --order and --profiles
+BOOK_ORDERS = {
+    "custom": CUSTOM_ORDER,
+    "canonical": CANONICAL_ORDER,
+    "tanakh": TANAKH_ORDER,
+    "chronological": CHRONOLOGICAL_ORDER,
+}
+
+# ================= BOOK NAMES =================
+BOOK_NAME_MAP = {
+    "Gen": "Genesis",
+    "Exo": "Exodus",
+    "Lev": "Leviticus",
+    "Num": "Numbers",
+    "Deu": "Deuteronomy",
+    "Jos": "Joshua",
+    "Jdg": "Judges",
+    "1Sam": "1 Samuel",
+    "2Sam": "2 Samuel",
+    "1Ki": "1 Kings",
+    "2Ki": "2 Kings",
+    "Isa": "Isaiah",
+    "Jer": "Jeremiah",
+    "Eze": "Ezekiel",
+    "Hos": "Hosea",
+    "Joe": "Joel",
+    "Amo": "Amos",
+    "Oba": "Obadiah",
+    "Jon": "Jonah",
+    "Mic": "Micah",
+    "Nah": "Nahum",
+    "Hab": "Habakkuk",
+    "Zep": "Zephaniah",
+    "Hag": "Haggai",
+    "Zec": "Zechariah",
+    "Mal": "Malachi",
+    "Psa": "Psalms", "Psalm": "Psalms",
+    "Pro": "Proverbs",
+    "Job": "Job",
+    "Son": "Song of Solomon",
+    "Rut": "Ruth",
+    "Lam": "Lamentations",
+    "Ecc": "Ecclesiastes",
+    "Est": "Esther",
+    "Dan": "Daniel",
+    "Ezr": "Ezra",
+    "Neh": "Nehemiah",
+    "1Ch": "1 Chronicles",
+    "2Ch": "2 Chronicles",
+    "Mat": "Matthew", "Matt": "Matthew",
+    "Mar": "Mark",
+    "Luk": "Luke",
+    "Joh": "John",
+    "Act": "Acts",
+    "Jam": "James", "Jas": "James",
+    "1Pe": "1 Peter", "1Pet": "1 Peter",
+    "2Pe": "2 Peter", "2Pet": "2 Peter",
+    "1Jo": "1 John", "1Joh": "1 John",
+    "2Jo": "2 John", "2Joh": "2 John",
+    "3Jo": "3 John", "3Joh": "3 John",
+    "Jud": "Jude",
+    "Rom": "Romans",
+    "1Co": "1 Corinthians", "1Cor": "1 Corinthians",
+    "2Co": "2 Corinthians", "2Cor": "2 Corinthians",
+    "Gal": "Galatians",
+    "Eph": "Ephesians",
+    "Php": "Philippians", "Phil": "Philippians",
+    "Col": "Colossians",
+    "1Th": "1 Thessalonians", "1Thes": "1 Thessalonians",
+    "2Th": "2 Thessalonians", "2Thes": "2 Thessalonians",
+    "Heb": "Hebrews",
+    "1Ti": "1 Timothy", "1Tim": "1 Timothy",
+    "2Ti": "2 Timothy", "2Tim": "2 Timothy",
+    "Tit": "Titus",
+    "Phm": "Philemon",
+    "Rev": "Revelation"
+}
+
+
+def fold_book_name(name):
+    """Case, spaces and dots don't matter when matching book names."""
+    return name.lower().replace(' ', '').replace('.', '')
+
+
+class BookTrie:
+    """Book names and abbreviations in a character trie.
+
+    resolve() accepts any prefix that still points to a single book, so
+    "Genes", "1Cor" and "Philem" work as well as the names and
+    abbreviations the trie was built from. Where a prefix is itself one of
+    those names ("Jud", "Phil") it resolves to that name's book.
+
+    With fold=False keys are stored exactly as given, which is what
+    match_chapter_line needs to accept the same lines as the old
+    ^(Genesis|Exodus|...|Revelation)\\s+(\\d+)$ alternation.
+    """
+
+    class Node:
+        __slots__ = ('children', 'exact', 'book')
+
+        def __init__(self):
+            self.children = {}
+            self.exact = None  # book whose name or abbreviation ends here
+            self.book = None   # book this prefix resolves to, None if ambiguous
+
+    def __init__(self, names, abbreviations=None, fold=True):
+        self.root = self.Node()
+        self.fold = fold_book_name if fold else str
+        for name in names:
+            self.add(name, name)
+        for abbreviation, name in (abbreviations or {}).items():
+            self.add(abbreviation, name)
+        self._settle(self.root)
+
+    def add(self, key, book):
+        node = self.root
+        for char in self.fold(key):
+            node = node.children.setdefault(char, self.Node())
+        node.exact = book
+
+    def _settle(self, node):
+        """Fill in node.book bottom-up; returns the set of books below node."""
+        books = {node.exact} if node.exact else set()
+        for child in node.children.values():
+            books |= self._settle(child)
+        node.book = node.exact or (next(iter(books)) if len(books) == 1 else None)
+        return books
+
+    def resolve(self, name):
+        """Book for a name, abbreviation or unambiguous prefix of one, else None."""
+        node = self.root
+        for char in self.fold(name):
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node.book
+
+    def match_chapter_line(self, line):
+        """(book, chapter) if line is a book name, whitespace and digits, else None.
+
+        One walk down the trie along the line; at each name that ends
+        before whitespace, the rest of the line is checked for being
+        whitespace then a number. Nothing is backtracked.
+        """
+        node = self.root
+        end = len(line)
+        for i, char in enumerate(line):
+            node = node.children.get(char)
+            if node is None:
+                return None
+            if node.exact and i + 1 < end and line[i + 1].isspace():
+                digits = line[i + 1:].lstrip()
+                if digits.isdecimal():
+                    return (line[:i + 1], digits)
+        return None
+
+
+# "Genesis 1" chapter lines use the full names only, spelled exactly
+BOOK_CHAPTER_TRIE = BookTrie(CUSTOM_ORDER, fold=False)
+
+# ================= FRONT MATTER =================
+COVER_TEXT = "THE HOLY BIBLE\n\nKing James Version"
+CONTENTS_TITLE = "CONTENTS"
+INTRODUCTION_TITLE = "INTRODUCTION"
+INTRODUCTION = ("This edition of the Holy Bible presents the text of the King James Version "
+                "in a clean, readable, and structured format.")
+
+# ================= FONT SIZES =================
+CHAPTER_FONT_SIZE = Pt(20)
+BOOK_DESCRIPTOR_SIZE = Pt(14)
+BOOK_NAME_SIZE = Pt(26)
+SECTION_HEADING_SIZE = Pt(12.5)
+
+# ================= STYLE NAMES =================
+# No spaces, so each name doubles as its w:styleId
+VERSE_STYLE = 'Verse'
+CHAPTER_STYLE = 'ChapterNumber'
+HEADING_STYLE = 'SectionHeading'
+DESCRIPTOR_STYLE = 'BookDescriptor'
+BOOK_NAME_STYLE = 'BookName'
+ITALIC_STYLE = 'Italic-Supplied'
+
+# ================= BOOK TITLES =================
+BOOK_TITLES = {
+    "Genesis": "The First Book of Moses, Called",
+    "Exodus": "The Second Book of Moses, Called",
+    "Leviticus": "The Third Book of Moses, Called",
+    "Numbers": "The Fourth Book of Moses, Called",
+    "Deuteronomy": "The Fifth Book of Moses, Called",
+    "Joshua": "The Book of",
+    "Judges": "The Book of",
+    "Ruth": "The Book of",
+    "1 Samuel": "The First Book of",
+    "2 Samuel": "The Second Book of",
+    "1 Kings": "The First Book of the Kings",
+    "2 Kings": "The Second Book of the Kings",
+    "1 Chronicles": "The First Book of the Chronicles",
+    "2 Chronicles": "The Second Book of the Chronicles",
+    "Ezra": "The Book of",
+    "Nehemiah": "The Book of",
+    "Esther": "The Book of",
+    "Job": "The Book of",
+    "Psalms": "The Book of",
+    "Proverbs": "The Proverbs",
+    "Ecclesiastes": "",
+    "Song of Solomon": "The Song of",
+    "Isaiah": "The Book of the Prophet",
+    "Jeremiah": "The Book of the Prophet",
+    "Lamentations": "The Lamentations of",
+    "Ezekiel": "The Book of the Prophet",
+    "Daniel": "The Book of",
+    "Hosea": "The Book of",
+    "Joel": "The Book of",
+    "Amos": "The Book of",
+    "Obadiah": "The Book of",
+    "Jonah": "The Book of",
+    "Micah": "The Book of",
+    "Nahum": "The Book of",
+    "Habakkuk": "The Book of",
+    "Zephaniah": "The Book of",
+    "Haggai": "The Book of",
+    "Zechariah": "The Book of",
+    "Malachi": "The Book of",
+    "Matthew": "The Gospel According to Saint",
+    "Mark": "The Gospel According to Saint",
+    "Luke": "The Gospel According to Saint",
+    "John": "The Gospel According to Saint",
+    "Acts": "The Acts of the Apostles",
+    "Romans": "The Epistle of Paul the Apostle to the",
+    "1 Corinthians": "The First Epistle of Paul the Apostle to the",
+    "2 Corinthians": "The Second Epistle of Paul the Apostle to the",
+    "Galatians": "The Epistle of Paul the Apostle to the",
+    "Ephesians": "The Epistle of Paul the Apostle to the",
+    "Philippians": "The Epistle of Paul the Apostle to the",
+    "Colossians": "The Epistle of Paul the Apostle to the",
+    "1 Thessalonians": "The First Epistle of Paul the Apostle to the",
+    "2 Thessalonians": "The Second Epistle of Paul the Apostle to the",
+    "1 Timothy": "The First Epistle of Paul the Apostle to",
+    "2 Timothy": "The Second Epistle of Paul the Apostle to",
+    "Titus": "The Epistle of Paul the Apostle to",
+    "Philemon": "The Epistle of Paul the Apostle to",
+    "Hebrews": "The Epistle of Paul the Apostle to the",
+    "James": "The General Epistle of",
+    "1 Peter": "The First Epistle General of",
+    "2 Peter": "The Second Epistle General of",
+    "1 John": "The First Epistle General of",
+    "2 John": "The Second Epistle General of",
+    "3 John": "The Third Epistle General of",
+    "Jude": "The General Epistle of",
+    "Revelation": "The Revelation of Saint John the Divine"
+}
+
+# ================= REGEX =================
+# Reordering (re-ordering processing.py)
+SOURCE_HEADER = re.compile(r'^([\w\d\s]+)\s+(\d+)')
+
+# Rendering (clean_kjv_stage17_heading1_tnr.py)
+JUNK_START = re.compile(r'^[\u25A0\u25A1\uFFFD\s]+')
+REMOVE_KJV_ONLINE = re.compile(r'KJV[\s_]*Online', re.IGNORECASE)
+CHAPTER_ONLY = re.compile(r'^\d+$')
+VERSE_LINE = re.compile(r'^(\d+)([\u202F\u00A0\s]+)(.*)')
+UNDERSCORE_ONLY = re.compile(r'^_+$')
+BOOK_TITLE_DASHED = re.compile(r'^-+\s*(.+?)\s*-+$')
+BOOK_CHAPTER_LINE = re.compile(r'^(.+?)\s+(\d+)$')
+
+
+# ================= TEXT SEGMENTS =================
+# A line travels through the pipeline as a tuple of (text, italic)
+# segments. Supplied words are marked italic once, where the source's
+# [brackets] are read or a .docx source's italic runs are, and reach the
+# renderer without being written out as _underscores_ and split apart
+# again.
+def plain_text(segments):
+    return ''.join(text for text, _ in segments)
+
+
+def plain_segments(text):
+    return ((text, False),) if text else ()
+
+
+def markup(segments):
+    """The _italics_ form of a line, as process_bible.py wrote it."""
+    return ''.join(f'_{text}_' if italic else text for text, italic in segments)
+
+
+def cut_segments(segments, start, stop):
+    """segments without the characters start:stop of their plain text."""
+    cut = []
+    pos = 0
+    for text, italic in segments:
+        end = pos + len(text)
+        if end <= start or pos >= stop:
+            cut.append((text, italic))
+        else:
+            kept = (text[:start - pos] if start > pos else '') + text[stop - pos:]
+            if kept:
+                cut.append((kept, italic))
+        pos = end
+    return tuple(cut)
+
+
+def rstrip_segments(segments, line, stripped):
+    """segments of line cut down to stripped, a prefix of it."""
+    trail = len(line) - len(stripped)
+    text, italic = segments[-1]
+    if len(text) > trail:
+        # the usual case: only the last segment loses characters
+        return segments[:-1] + ((text[:-trail], italic),)
+    return cut_segments(segments, len(stripped), len(line))
+
+
+def strip_segments(segments):
+    """str.strip for a segmented line."""
+    line = plain_text(segments)
+    stripped = line.rstrip()
+    if len(stripped) < len(line):
+        segments = rstrip_segments(segments, line, stripped)
+    if not stripped[:1].isspace():
+        return segments
+    lead = len(stripped) - len(stripped.lstrip())
+    if lead:
+        segments = cut_segments(segments, 0, lead)
+    return segments
+
+
+# ================= NORMALIZATION =================
+# The rewrites are process_bible.py's own. A "Holy Ghost" may run across
+# a line break there and come out on one line, so the lines it may span
+# are joined before the rewrites and split again after them.
+def normalize_segments(segments):
+    """The process_bible.py rewrites of a segmented line; an italic segment stays italic throughout."""
+    if len(segments) == 1 and not segments[0][1]:
+        return rewrite_segments(segments[0][0])
+    normalized = []
+    for text, italic in segments:
+        for part, part_italic in rewrite_segments(text):
+            part_italic = part_italic or italic
+            if normalized and normalized[-1][1] == part_italic:
+                normalized[-1] = (normalized[-1][0] + part, part_italic)
+            else:
+                normalized.append((part, part_italic))
+    return tuple(normalized)
+
+
+def join_segments(first, second):
+    if first and second and first[-1][1] == second[0][1]:
+        return first[:-1] + ((first[-1][0] + second[0][0], second[0][1]),) + second[1:]
+    return first + second
+
+
+def split_lines(segments):
+    """Yield the lines of segments holding newlines, each ending with its newline."""
+    line = []
+    for text, italic in segments:
+        *ended, rest = text.split('\n')
+        for part in ended:
+            line.append((part + '\n', italic))
+            yield tuple(line)
+            line = []
+        if rest or not ended:
+            line.append((rest, italic))
+    if line:
+        yield tuple(line)
+
+
+def runs_on(held, line):
+    """Whether a "Holy Ghost" may run from the end of held, a line ending in a newline, into line."""
+    tail = held[-1][0].rstrip()
+    if len(tail) >= 4 and not HOLY_WORD.match(tail, len(tail) - 4):
+        return False
+    text = plain_text(held)
+    return text.endswith('\n') and holy_across(text + plain_text(line), len(text) - 1)
+
+
+def iter_rewritten_lines(lines):
+    """normalize_segments for each segmented line, the lines a "Holy Ghost"
+    may run across rewritten together and split again afterwards."""
+    held = None
+    joined = False
+    for line in lines:
+        if held is not None:
+            if runs_on(held, line):
+                held = join_segments(held, line)
+                joined = True
+                continue
+            yield from split_lines(normalize_segments(held)) if joined else (normalize_segments(held),)
+        held, joined = line, False
+    if held is not None:
+        yield from split_lines(normalize_segments(held)) if joined else (normalize_segments(held),)
+
+
+def iter_source_lines(filepath):
+    """Lines of the source as segments, read from a .docx directly or from a text export.
+
+    A .docx's italic runs arrive as italic segments; a text export has
+    only plain ones.
+    """
+    if filepath.lower().endswith(DOCX_EXT):
+        yield from iter_docx_run_lines(filepath)
+    else:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield plain_segments(line)
+
+
+def iter_normalized_lines(filepath, normalized_file=None):
+    """Stream source lines through normalization, optionally keeping a copy on disk.
+
+    The copy is the _italics_ text process_bible.py wrote; the pipeline
+    itself only sees segments.
+    """
+    out_f = open(normalized_file, 'w', encoding='utf-8') if normalized_file else None
+    try:
+        for segments in iter_rewritten_lines(iter_source_lines(filepath)):
+            if out_f:
+                out_f.write(markup(segments))
+            yield segments
+    finally:
+        if out_f:
+            out_f.close()
+
+
+# ================= REORDERING =================
+def standardize_book_name(raw_name):
+    """Clean and map a raw book name to the standard form."""
+    # Remove numbers or "The Book of" prefixes if present
+    raw_name = raw_name.replace("The Book of", "").strip()
+    # Unspaced abbreviations such as "1Cor" and "2Ki" are keys as they are
+    if raw_name in BOOK_NAME_MAP:
+        return BOOK_NAME_MAP[raw_name]
+    # If the name starts with a number, separate it (e.g., "1Samuel" -> "1 Samuel")
+    raw_name = re.sub(r'^(\d)([A-Za-z])', r'\1 \2', raw_name)
+
+    # Check mapping, otherwise assume it's already standard
+    return BOOK_NAME_MAP.get(raw_name, raw_name)
+
+
+def parse_lines(lines):
+    """Group normalized lines by book and chapter, like parse_source_file does for a file."""
+    bible_dict = {}
+    current_book = None
+    current_chapter = None
+    chapter_text = []
+
+    for segments in lines:
+        line = plain_text(segments).strip()
+        if not line:
+            continue
+
+        match = SOURCE_HEADER.match(line)
+        if match:
+            if current_book and current_chapter is not None:
+                bible_dict.setdefault(current_book, {})[current_chapter] = chapter_text
+                chapter_text = []
+
+            current_book = standardize_book_name(match.group(1).strip())
+            current_chapter = int(match.group(2))
+        elif current_book and current_chapter is not None:
+            chapter_text.append(strip_segments(segments))
+
+    if current_book and current_chapter is not None:
+        bible_dict.setdefault(current_book, {})[current_chapter] = chapter_text
+
+    return bible_dict
+
+
+def iter_reordered_lines(bible_dict, order=CUSTOM_ORDER):
+    """Yield the lines reorder_and_output would write, without touching the disk."""
+    for book_name in order:
+        if book_name in bible_dict:
+            # "\n\n--- {book_name} ---\n\n"
+            yield ()
+            yield ()
+            yield plain_segments(f"--- {book_name} ---")
+            yield ()
+            chapters = bible_dict[book_name]
+            for chap_num in sorted(chapters.keys()):
+                yield plain_segments(f"{book_name} {chap_num}")
+                yield from chapters[chap_num]
+                yield ()
+
+
+def tee_lines(lines, filepath):
+    """Pass lines through unchanged while writing their _italics_ text to filepath."""
+    with open(filepath, 'w', encoding='utf-8') as out_f:
+        for segments in lines:
+            out_f.write(markup(segments) + "\n")
+            yield segments
+
+
+# ================= CLASSIFICATION =================
+JUNK_CHARS = '\u25A0\u25A1\uFFFD'
+
+
+def clean_segments(segments):
+    """The stage17 clean-up of a line: trailing space, KJV Online tags, leading junk.
+
+    Returns the cleaned plain text and the segments it came from.
+    """
+    line = plain_text(segments)
+    stripped = line.rstrip()
+    if len(stripped) < len(line):
+        segments = rstrip_segments(segments, line, stripped)
+        line = stripped
+    if 'kjv' in line.lower():
+        for match in reversed(list(REMOVE_KJV_ONLINE.finditer(line))):
+            segments = cut_segments(segments, match.start(), match.end())
+        line = REMOVE_KJV_ONLINE.sub('', line)
+    if line and (line[0] in JUNK_CHARS or line[0].isspace()):
+        junk = JUNK_START.match(line)
+        if junk:
+            segments = cut_segments(segments, 0, junk.end())
+            line = line[junk.end():]
+    return line, segments
+
+
+def classify_segments(segments):
+    """Decide what a reordered line is in one pass over its first and last characters.
+
+    Returns (kind, segments, groups): kind is 'spacer', 'book', 'chapter',
+    'verse' or 'heading', segments is the cleaned line and groups are the
+    captures of the regex that the stage17 chain would have matched on
+    its text: (book,) for BOOK_TITLE_DASHED, (book, chapter) for a book
+    chapter line, (None, chapter) for CHAPTER_ONLY and (number, space,
+    text) for VERSE_LINE. The precedence of the chain is kept; the regexes
+    only run once the characters at either end say they can match.
+
+    Book chapter lines are recognised by BOOK_CHAPTER_TRIE, so only real
+    book names count: stage17's BOOK_CHAPTER_LINE took any line ending in
+    a number, which on the KJV source happens to select the same lines.
+    """
+    line, segments = clean_segments(segments)
+
+    if not line or line.isspace():
+        return ('spacer', segments, ())
+
+    first = line[0]
+    if first == '_' and not line.strip('_'):
+        return ('spacer', segments, ())
+
+    if first == '-':
+        dashed = BOOK_TITLE_DASHED.match(line)
+        if dashed:
+            book = dashed.group(1).strip()
+            if book in BOOK_TITLES:
+                return ('book', segments, (book,))
+
+    if first.isdecimal() and line.isdecimal():
+        return ('chapter', segments, (None, line))
+
+    if line[-1].isdecimal():
+        bc = BOOK_CHAPTER_TRIE.match_chapter_line(line)
+        if bc:
+            return ('chapter', segments, bc)
+
+    if first.isdecimal():
+        verse = VERSE_LINE.match(line)
+        if verse:
+            return ('verse', segments, verse.groups())
+
+    return ('heading', segments, ())
+
+
+def classify_line(raw):
+    """classify_segments for a line of text; returns (kind, cleaned line, groups)."""
+    kind, segments, groups = classify_segments(plain_segments(raw))
+    return (kind, plain_text(segments), groups)
+
+
+def iter_blocks(lines, metrics=None, chapters=False):
+    """Classify reordered lines into the blocks the stage17 builder renders.
+
+    Yields ('book', name), ('verse', chapter, segments) and
+    ('heading', segments) tuples. chapter is the pending chapter number
+    for the paragraph that opens a chapter and None otherwise; segments
+    is what goes through add_text_with_italics. A kjv_metrics.BuildMetrics
+    passed as metrics counts every line and block. chapters=True also
+    yields a ('chapter', number) marker where each chapter line was, for
+    renderers that place chapters before their headings; it renders to
+    no paragraph of its own.
+    """
+    pending_chapter = None
+
+    for line in lines:
+        kind, segments, groups = classify_segments(line)
+        if metrics:
+            junk = len(plain_text(segments)) < len(plain_text(line).rstrip())
+            metrics.count_line(kind, junk)
+
+        if kind == 'verse':
+            vnum = groups[0]
+            if vnum == "1" and pending_chapter:
+                segments = cut_segments(segments, 0, len(vnum))
+                block = ('verse', pending_chapter, segments)
+                pending_chapter = None
+            else:
+                block = ('verse', None, segments)
+            if metrics:
+                metrics.count_block(1, segments)
+            yield block
+
+        elif kind == 'chapter':
+            pending_chapter = groups[1]
+            if chapters:
+                yield ('chapter', pending_chapter)
+
+        elif kind == 'book':
+            book = groups[0]
+            if metrics:
+                metrics.count_block(2 if BOOK_TITLES[book] else 1)
+            yield ('book', book)
+
+        elif kind == 'heading':
+            if metrics:
+                metrics.count_block(1, segments)
+            yield ('heading', segments)
+
+
+# ================= RENDERING =================
+def add_toc(document):
+    p = document.add_paragraph()
+    run = p.add_run()
+    fldChar = OxmlElement('w:fldChar')
+    fldChar.set(ns.qn('w:fldCharType'), 'begin')
+    run._r.append(fldChar)
+
+    instrText = OxmlElement('w:instrText')
+    instrText.text = 'TOC \\o "1-1" \\h \\z \\u'
+    run._r.append(instrText)
+
+    fldChar = OxmlElement('w:fldChar')
+    fldChar.set(ns.qn('w:fldCharType'), 'end')
+    run._r.append(fldChar)
+
+
+class RunBuilder:
+    """Turn a line's segments into the fewest (text, italic) runs.
+
+    Cleaning can leave empty segments or two neighbours with the same
+    formatting; empty ones are dropped and neighbours merged. saved counts
+    the segments that never become runs of their own.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.saved = 0
+
+    def segments(self, segments):
+        merged = []
+        for text, italic in segments:
+            if not text:
+                continue
+            if merged and merged[-1][1] == italic:
+                merged[-1] = (merged[-1][0] + text, italic)
+            else:
+                merged.append((text, italic))
+
+        self.runs += len(merged)
+        self.saved += len(segments) - len(merged)
+        return merged
+
+
+def add_text_with_italics(p, segments, runs):
+    for part, italic in runs.segments(segments):
+        r = p.add_run(part)
+        if italic:
+            r.italic = True
+        r.font.name = 'Times New Roman'
+
+
+def add_text_with_styles(p, segments, runs):
+    """add_text_with_italics for styled documents: plain runs carry no rPr."""
+    for part, italic in runs.segments(segments):
+        r = p.add_run(part)
+        if italic:
+            r._r.style = ITALIC_STYLE
+
+
+def force_times_new_roman(rPr):
+    """Replace theme fonts in rPr; Word lets asciiTheme win over ascii when both apply."""
+    rFonts = rPr.get_or_add_rFonts()
+    for attr in ('w:asciiTheme', 'w:hAnsiTheme', 'w:eastAsiaTheme', 'w:cstheme'):
+        rFonts.attrib.pop(ns.qn(attr), None)
+    rFonts.set(ns.qn('w:ascii'), 'Times New Roman')
+    rFonts.set(ns.qn('w:hAnsi'), 'Times New Roman')
+
+
+def add_styles(doc):
+    """Define the Bible text styles once so paragraphs and runs only reference them.
+
+    Without the theme fonts in the document defaults and Heading 1, the
+    Normal style's Times New Roman applies everywhere and runs no longer
+    need their own w:rFonts.
+    """
+    styles = doc.styles
+    defaults = styles.element.find(ns.qn('w:docDefaults'))
+    force_times_new_roman(defaults.find(ns.qn('w:rPrDefault')).find(ns.qn('w:rPr')))
+    force_times_new_roman(styles['Heading 1'].element.get_or_add_rPr())
+
+    verse = styles.add_style(VERSE_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+    verse.base_style = styles['Normal']
+
+    heading = styles.add_style(HEADING_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+    heading.base_style = styles['Normal']
+    heading.font.bold = True
+    heading.font.size = SECTION_HEADING_SIZE
+
+    descriptor = styles.add_style(DESCRIPTOR_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+    descriptor.base_style = styles['Normal']
+    descriptor.font.size = BOOK_DESCRIPTOR_SIZE
+    descriptor.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    # Based on Heading 1 so the outline level keeps book names in the TOC
+    book_name = styles.add_style(BOOK_NAME_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+    book_name.base_style = styles['Heading 1']
+    book_name.font.bold = True
+    book_name.font.size = BOOK_NAME_SIZE
+    book_name.font.color.rgb = RGBColor(0, 0, 0)
+    book_name.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    chapter = styles.add_style(CHAPTER_STYLE, WD_STYLE_TYPE.CHARACTER)
+    chapter.font.bold = True
+    chapter.font.size = CHAPTER_FONT_SIZE
+
+    italic = styles.add_style(ITALIC_STYLE, WD_STYLE_TYPE.CHARACTER)
+    italic.font.italic = True
+
+
+def add_base_style(doc):
+    """Times New Roman 11pt for the Normal style everything builds on."""
+    style = doc.styles['Normal']
+    style.font.name = 'Times New Roman'
+    style.font.size = Pt(11)
+
+
+def add_front_matter(doc):
+    """Base style, cover, contents and introduction pages."""
+    add_base_style(doc)
+
+    cover = doc.add_paragraph(COVER_TEXT)
+    cover.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    for r in cover.runs:
+        r.bold = True
+        r.font.name = 'Times New Roman'
+        r.font.size = Pt(30)
+
+    doc.add_page_break()
+
+    toc_title = doc.add_paragraph(CONTENTS_TITLE)
+    toc_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    for r in toc_title.runs:
+        r.bold = True
+        r.font.name = 'Times New Roman'
+        r.font.size = Pt(20)
+
+    add_toc(doc)
+    doc.add_page_break()
+
+    intro = doc.add_paragraph(f"{INTRODUCTION_TITLE}\n\n{INTRODUCTION}")
+    for r in intro.runs:
+        r.bold = True
+        r.font.name = 'Times New Roman'
+
+    doc.add_page_break()
+
+
+def render_lines(doc, lines, runs):
+    """Add the reordered Bible lines to doc exactly as the stage17 builder does."""
+    render_blocks(doc, iter_blocks(lines), runs)
+
+
+def render_blocks(doc, blocks, runs):
+    """render_lines for lines that iter_blocks has already classified."""
+    for block in blocks:
+        kind = block[0]
+
+        if kind == 'book':
+            book = block[1]
+            descriptor = BOOK_TITLES[book]
+
+            if descriptor:
+                p1 = doc.add_paragraph(descriptor)
+                p1.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                r1 = p1.runs[0]
+                r1.font.name = 'Times New Roman'
+                r1.font.size = BOOK_DESCRIPTOR_SIZE
+
+            p2 = doc.add_heading(book.upper(), level=1)
+            p2.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            r2 = p2.runs[0]
+            r2.bold = True
+            r2.font.name = 'Times New Roman'
+            r2.font.size = BOOK_NAME_SIZE
+            r2.font.color.rgb = RGBColor(0, 0, 0)
+
+        elif kind == 'verse':
+            chapter, segments = block[1], block[2]
+            p = doc.add_paragraph()
+            if chapter:
+                r = p.add_run(chapter)
+                r.bold = True
+                r.font.name = 'Times New Roman'
+                r.font.size = CHAPTER_FONT_SIZE
+            add_text_with_italics(p, segments, runs)
+
+        else:
+            p = doc.add_paragraph()
+            add_text_with_italics(p, block[1], runs)
+            for r in p.runs:
+                r.bold = True
+                r.font.size = SECTION_HEADING_SIZE
+
+
+def render_styled_lines(doc, lines, runs):
+    """Add the reordered Bible lines to doc using the styles from add_styles."""
+    render_styled_blocks(doc, iter_blocks(lines), runs)
+
+
+def render_styled_blocks(doc, blocks, runs):
+    """render_styled_lines for lines that iter_blocks has already classified.
+
+    Style ids are written straight onto the elements; going through
+    Paragraph.style would look every style up by name for each paragraph.
+    """
+    for block in blocks:
+        kind = block[0]
+
+        if kind == 'book':
+            book = block[1]
+            descriptor = BOOK_TITLES[book]
+            if descriptor:
+                doc.add_paragraph(descriptor)._p.style = DESCRIPTOR_STYLE
+            doc.add_paragraph(book.upper())._p.style = BOOK_NAME_STYLE
+
+        elif kind == 'verse':
+            chapter, segments = block[1], block[2]
+            p = doc.add_paragraph()
+            p._p.style = VERSE_STYLE
+            if chapter:
+                p.add_run(chapter)._r.style = CHAPTER_STYLE
+            add_text_with_styles(p, segments, runs)
+
+        else:
+            p = doc.add_paragraph()
+            p._p.style = HEADING_STYLE
+            add_text_with_styles(p, block[1], runs)
+
+
+def render_docx(lines, output_file, styled=True, metrics=None):
+    """Build the document with python-docx; returns the RunBuilder used."""
+    runs = RunBuilder()
+    blocks = timed(metrics, iter_blocks(lines, metrics), 'classifying')
+    with phase(metrics, 'building'):
+        doc = Document()
+        add_front_matter(doc)
+        if styled:
+            add_styles(doc)
+            render_styled_blocks(doc, blocks, runs)
+        else:
+            render_blocks(doc, blocks, runs)
+    with phase(metrics, 'saving'):
+        doc.save(output_file)
+    return runs
+
+
+# ================= PIPELINE =================
+def profile_path(path, profile):
+    """path with the profile name added before the extension, for one file per profile."""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{profile}{ext}"
+
+
+def run_pipeline(input_file=INPUT_FILE, output_file=OUTPUT_FILE,
+                 normalized_file=None, reordered_file=None, streaming=False,
+                 styled=True, order=CUSTOM_ORDER, workers=0, cache_dir=None,
+                 metrics_file=None, manifest=False, profiles=None, formats=None, shards=False):
+    """Normalize, reorder and render in one process.
+
+    The intermediate text files that process_bible.py and
+    re-ordering processing.py used to produce are only written when a path
+    is given for them. input_file may also be a corpus compiled by
+    kjv_corpus.py, which is mapped instead of parsed. streaming=True writes document.xml incrementally
+    through kjv_docx_stream instead of building a python-docx tree.
+    styled=False repeats the stage17 direct formatting on every run instead
+    of referencing the styles from add_styles. workers > 0 renders each
+    book in a process pool and cache_dir reuses books rendered by earlier
+    builds (see kjv_docx_stream.write_docx_by_book).
+
+    metrics_file gets a kjv_metrics report of the build: line counts per
+    classification, paragraphs, runs and italic segments, and the time
+    spent reading, classifying, building and saving. Books rendered by
+    workers or taken from the cache are classified once more in this
+    process for the counts, and their building time includes saving.
+
+    manifest=True fingerprints every paragraph of the finished document
+    into a kjv_manifest file next to output_file.
+
+    profiles, a list of BOOK_ORDERS names, builds one edition per profile
+    from the same parsed corpus in place of order; each edition's output,
+    reordered text and metrics go to profile_path() of the given paths.
+    The parse is counted in the first edition's metrics.
+
+    formats, a list of kjv_formats.FORMATS names such as ['docx', 'epub',
+    'html'], renders all of them from one pass over the classified blocks,
+    each next to output_file with its own extension; DOCX then comes from
+    the streaming writer.
+
+    shards=True writes one file per book (per format) into a directory
+    next to output_file instead, rendered by workers processes and
+    listed in order in its index.json; books whose text is unchanged
+    since the last sharded build are not rendered again (see kjv_shards).
+    It takes no reordered_file or metrics_file, which describe a single
+    edition rendered in one pass.
+    """
+    from kjv_corpus import CORPUS_EXT, Corpus
+
+    if shards and (reordered_file or metrics_file):
+        raise ValueError("shards are rendered book by book; reordered_file and metrics_file don't apply")
+    metrics = BuildMetrics() if metrics_file else None
+    with phase(metrics, 'reading'):
+        if input_file.endswith(CORPUS_EXT):
+            bible_dict = Corpus.load(input_file)
+        else:
+            lines = iter_normalized_lines(input_file, normalized_file)
+            bible_dict = Corpus.from_lines(lines)
+    print(f"Found {len(bible_dict)} books.")
+
+    options = dict(streaming=streaming, styled=styled, workers=workers, cache_dir=cache_dir,
+                   manifest=manifest, formats=formats, shards=shards)
+    if not profiles:
+        build_edition(bible_dict, input_file, output_file, order, reordered_file=reordered_file,
+                      metrics=metrics, metrics_file=metrics_file, **options)
+        return
+
+    for profile in profiles:
+        print(f"Profile {profile}:")
+        build_edition(bible_dict, input_file, profile_path(output_file, profile), BOOK_ORDERS[profile],
+                      reordered_file=reordered_file and profile_path(reordered_file, profile),
+                      metrics=metrics, metrics_file=metrics_file and profile_path(metrics_file, profile),
+                      **options)
+        metrics = BuildMetrics() if metrics_file else None
+
+
+def build_edition(bible_dict, input_file, output_file, order, *, reordered_file=None, streaming=False,
+                  styled=True, workers=0, cache_dir=None, metrics=None, metrics_file=None,
+                  manifest=False, formats=None, shards=False):
+    """Render bible_dict's books in order to output_file; the rendering half of run_pipeline.
+
+    The options are keyword-only and mean what they do for run_pipeline.
+    """
+    lines = timed(metrics, iter_reordered_lines(bible_dict, order), 'reading')
+    if reordered_file:
+        lines = tee_lines(lines, reordered_file)
+
+    if shards:
+        from kjv_shards import shard_dir, write_shards
+        directory = shard_dir(output_file)
+        runs, output_file, rendered = write_shards(bible_dict, directory, order, formats or ['docx'],
+                                                   styled, workers, manifest)
+        print(f"Rendered {rendered} books into {directory}; the others were unchanged.")
+    elif formats:
+        from kjv_formats import format_path, render_formats
+        renderers = render_formats(lines, output_file, formats, styled, metrics)
+        runs = renderers[formats.index('docx') if 'docx' in formats else 0].runs
+        for renderer in renderers:
+            print(f"Wrote {renderer.output_file}")
+        output_file = format_path(output_file, 'docx') if 'docx' in formats else None
+    elif workers or cache_dir:
+        from kjv_docx_stream import write_docx_by_book
+        from kjv_cache import BookCache
+        if metrics:
+            lines = timed(metrics, iter_blocks(lines, metrics), 'classifying')
+        if reordered_file or metrics:
+            for _ in lines:
+                pass
+        cache = BookCache(cache_dir) if cache_dir else None
+        with phase(metrics, 'building'):
+            runs = write_docx_by_book(bible_dict, output_file, order, styled, workers, cache)
+        if cache:
+            print(f"Book cache: {cache.hits} reused, {cache.misses} rendered.")
+    elif streaming:
+        from kjv_docx_stream import write_docx
+        runs = write_docx(lines, output_file, styled, metrics)
+    else:
+        runs = render_docx(lines, output_file, styled, metrics)
+    print(f"Wrote {runs.runs} text runs ({runs.saved} empty or duplicate runs dropped).")
+    if metrics:
+        writer = ('formats' if formats else 'by book' if workers or cache_dir
+                  else 'streaming' if streaming else 'python-docx')
+        metrics.write(metrics_file, runs, input=input_file, output=output_file, writer=writer,
+                      styled=styled, formats=formats or None)
+        print(f"Metrics written to {metrics_file}")
+    if manifest and output_file and not shards:
+        from kjv_manifest import write_manifest
+        print(f"Manifest written to {write_manifest(output_file)}")
+    if output_file:
+        print(f"Finished: {output_file} created")
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the KJV DOCX from the source text in one pass.")
+    parser.add_argument("input", nargs="?", default=INPUT_FILE,
+                        help="kjv.docx, its plain text export or a compiled .kjvc corpus")
+    parser.add_argument("output", nargs="?", default=OUTPUT_FILE)
+    parser.add_argument("--normalized", help="also write the process_bible.py output here")
+    parser.add_argument("--reordered", help="also write the re-ordering processing.py output here")
+    parser.add_argument("--streaming", action="store_true",
+                        help="write document.xml incrementally instead of through python-docx")
+    parser.add_argument("--direct-formatting", action="store_true",
+                        help="format every run directly like the stage17 builder instead of using named styles")
+    parser.add_argument("--order", choices=sorted(BOOK_ORDERS), default="custom",
+                        help="book order of the output (default: CUSTOM_ORDER)")
+    parser.add_argument("--profiles", type=lambda names: names.split(','), metavar="NAME,...",
+                        help="build one edition per book order from a single parse, written to "
+                             "OUTPUT_<name>.docx; 'all' for every profile (%s)" % ', '.join(BOOK_ORDERS))
+    parser.add_argument("--formats", type=lambda names: names.split(','), metavar="FORMAT,...",
+                        help="render these formats in one pass, next to OUTPUT with their own extensions "
+                             "(docx, epub, html, jsonl, txt)")
+    parser.add_argument("--shards", action="store_true",
+                        help="write one file per book into OUTPUT_books/ with an index.json, "
+                             "rendering only the books that changed")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="render books in this many processes and merge them in order")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="reuse rendered books from DIR when their text and layout are unchanged")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write line counts and phase timings of the build to FILE as JSON")
+    parser.add_argument("--manifest", action="store_true",
+                        help="write per-paragraph fingerprints of the output next to it (see kjv_manifest.py)")
+    args = parser.parse_args()
+    if args.profiles == ['all']:
+        args.profiles = list(BOOK_ORDERS)
+    for name in args.profiles or ():
+        if name not in BOOK_ORDERS:
+            parser.error(f"unknown profile {name!r} (choose from {', '.join(BOOK_ORDERS)})")
+    if args.formats:
+        from kjv_formats import FORMATS
+        for name in args.formats:
+            if name not in FORMATS:
+                parser.error(f"unknown format {name!r} (choose from {', '.join(FORMATS)})")
+        if (args.workers or args.cache) and not args.shards:
+            parser.error("--formats renders in one pass and can't be combined with --workers or --cache")
+    if args.shards and args.cache:
+        parser.error("--shards keeps its own files up to date; --cache doesn't apply")
+    if args.shards and (args.reordered or args.metrics):
+        parser.error("--shards renders book by book; --reordered and --metrics describe a whole edition")
+
+    run_pipeline(args.input, args.output, args.normalized, args.reordered, args.streaming,
+                 styled=not args.direct_formatting, order=BOOK_ORDERS[args.order],
+                 workers=args.workers, cache_dir=args.cache, metrics_file=args.metrics,
+                 manifest=args.manifest, profiles=args.profiles, formats=args.formats,
+                 shards=args.shards)
@@ -0,0 +1,125 @@
+import mmap
+import os
+import sys
+import tempfile
+
+from kjv_pipeline import BOOK_ORDERS, CUSTOM_ORDER, SOURCE_HEADER, standardize_book_name
+
+# Two-pass replacement for re-ordering processing.py. The first pass only
+# records where each chapter's lines sit in the file; the second copies
+# those byte ranges out of a memory map in CUSTOM_ORDER. Memory grows with
+# the number of chapters instead of the size of the text, and lines go
+# from the map to the output without being decoded again. The result is
+# written next to the output and swapped in once complete, so reordering
+# kjv_formatted.txt in place (as the old script did) can no longer leave
+# it half written.
+#
+#   python kjv_reorder.py                                # kjv_formatted.txt in place
+#   python kjv_reorder.py kjv_normalized.txt kjv_reordered.txt
+
+
+def index_chapters(data):
+    """{book: {chapter: [(start, stop)]}} for the lines of a file opened in binary mode.
+
+    Each chapter's non-blank lines, stripped, joined with newlines, are
+    the bytes of its ranges joined with newlines: neighbouring lines that
+    need no stripping share a single range. A chapter that appears twice
+    keeps its last copy, as parse_source_file did.
+    """
+    index = {}
+    ranges = None
+    end = 0
+
+    for raw in data:
+        start = end
+        end += len(raw)
+        line = raw.decode('utf-8')
+        stripped = line.strip()
+        if not stripped:
+            continue
+
+        match = SOURCE_HEADER.match(stripped)
+        if match:
+            book = standardize_book_name(match.group(1).strip())
+            ranges = index.setdefault(book, {})[int(match.group(2))] = []
+            continue
+        if ranges is None:
+            continue
+
+        lead = len(line) - len(line.lstrip())
+        if lead:
+            start += len(line[:lead].encode('utf-8'))
+        stop = start + len(stripped.encode('utf-8'))
+        if ranges and ranges[-1][1] + 1 == start:
+            # the previous line ran up to this one's newline
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((start, stop))
+
+    return index
+
+
+def write_reordered(data, index, out, order=CUSTOM_ORDER):
+    """Write the chapters in index to out the way reorder_and_output does."""
+    view = memoryview(data)
+    try:
+        for book_name in order:
+            if book_name not in index:
+                continue
+            out.write(f"\n\n--- {book_name} ---\n\n".encode('utf-8'))
+            chapters = index[book_name]
+            for chap_num in sorted(chapters):
+                out.write(f"{book_name} {chap_num}\n".encode('utf-8'))
+                for i, (start, stop) in enumerate(chapters[chap_num]):
+                    if i:
+                        out.write(b'\n')
+                    out.write(view[start:stop])
+                out.write(b'\n\n')
+    finally:
+        view.release()
+
+
+def file_mode(path):
+    """Permissions for a new file at path: those of the file it replaces, or the umask's."""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def reorder_file(input_file, output_file=None, order=CUSTOM_ORDER):
+    """Reorder input_file's books into output_file (default: input_file itself).
+
+    Returns the number of books found. The output only replaces an
+    existing file once it has been written in full.
+    """
+    output_file = output_file or input_file
+    directory = os.path.dirname(os.path.abspath(output_file))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.reorder-', suffix='.tmp')
+    try:
+        with open(input_file, 'rb') as f, os.fdopen(fd, 'wb') as out:
+            index = index_chapters(f)
+            if index:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    write_reordered(data, index, out, order)
+        os.chmod(tmp, file_mode(output_file))
+        os.replace(tmp, output_file)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return len(index)
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    input_file = sys.argv[1] if len(sys.argv) > 1 else "kjv_formatted.txt"
+    output_file = sys.argv[2] if len(sys.argv) > 2 else input_file
+    order = BOOK_ORDERS[sys.argv[3]] if len(sys.argv) > 3 else CUSTOM_ORDER
+
+    print("Reordering...")
+    books = reorder_file(input_file, output_file, order)
+    print(f"Found {books} books.")
+    print(f"Done! Output written to {output_file}")
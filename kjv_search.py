@@ -0,0 +1,258 @@
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+from kjv_corpus import CORPUS_EXT, Corpus, aligned
+from kjv_pipeline import iter_normalized_lines
+
+# Positional inverted index over the verses of a Corpus, i.e. over the
+# same normalized text the builders render (spirit/holy spirit rewrites
+# applied, italics dropped). Postings are kept varint-encoded
+# per token and only decoded for the tokens a query asks about.
+#
+# For a compiled corpus the postings are saved next to it (kjv.kjvs for
+# kjv.kjvc) and mapped back in by later searches. The file records a
+# digest of the verses it was built from and is rebuilt when the corpus
+# no longer matches it.
+
+TOKEN = re.compile(r'[^\W_]+')
+
+# ================= BINARY FORMAT =================
+# The header, the tokens joined by newlines, a 'Q' column of postings
+# offsets (one more than there are tokens) and the postings blob, each
+# section starting on an 8-byte boundary like a compiled corpus.
+SEARCH_EXT = ".kjvs"
+SEARCH_MAGIC = b'KJVS'
+SEARCH_VERSION = 1
+DIGEST_SIZE = 16
+# magic, version, token count, tokens length, postings length, corpus digest
+SEARCH_HEADER = struct.Struct(f'<4sH2xQQQ{DIGEST_SIZE}s')
+
+
+def search_path(corpus_file):
+    return os.path.splitext(corpus_file)[0] + SEARCH_EXT
+
+
+def corpus_digest(corpus):
+    """Hash of what an index is built from: the text and where each verse sits in it."""
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    h.update(corpus.verse_offset)
+    h.update(corpus.verse_length)
+    h.update(corpus.text)
+    return h.digest()
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data):
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = shift = 0
+
+
+class SearchIndex:
+    """Word, phrase and proximity search returning verse rows of the corpus.
+
+    Each token's postings are one bytes-like object of varints: for every
+    verse that contains it, the row delta, the number of positions, then
+    the position deltas.
+    """
+
+    def __init__(self, corpus, postings=None):
+        self.corpus = corpus
+        self.postings = postings
+        if postings is not None:
+            return
+        self.postings = {}
+
+        building = {}
+        for row in range(len(corpus.verse_offset)):
+            for position, token in enumerate(tokenize(corpus.verse_text(row))):
+                rows = building.setdefault(token, {})
+                rows.setdefault(row, []).append(position)
+
+        for token, rows in building.items():
+            out = bytearray()
+            last_row = 0
+            for row, positions in rows.items():
+                encode_varint(row - last_row, out)
+                encode_varint(len(positions), out)
+                last_position = 0
+                for position in positions:
+                    encode_varint(position - last_position, out)
+                    last_position = position
+                last_row = row
+            self.postings[token] = bytes(out)
+
+    # ================= SAVED INDEXES =================
+    def save(self, path):
+        """Write the postings in the format load() maps back in."""
+        tokens = list(self.postings)
+        names = '\n'.join(tokens).encode('utf-8')
+        offsets = array('Q', [0])
+        for token in tokens:
+            offsets.append(offsets[-1] + len(self.postings[token]))
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(SEARCH_HEADER.pack(SEARCH_MAGIC, SEARCH_VERSION, len(tokens), len(names),
+                                       offsets[-1], corpus_digest(self.corpus)))
+            for section in (names, offsets):
+                f.write(b'\0' * (aligned(f.tell()) - f.tell()))
+                f.write(section)
+            f.write(b'\0' * (aligned(f.tell()) - f.tell()))
+            for token in tokens:
+                f.write(self.postings[token])
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, corpus):
+        """Map an index saved by save(); ValueError if it isn't one or was built from another corpus.
+
+        Postings are views of the mapping, decoded only when a query asks.
+        """
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        if len(view) < SEARCH_HEADER.size:
+            raise ValueError(f"{path} is not a search index")
+        magic, version, token_count, names_length, postings_length, digest = SEARCH_HEADER.unpack_from(view)
+        if magic != SEARCH_MAGIC or version != SEARCH_VERSION:
+            raise ValueError(f"{path} is not a version {SEARCH_VERSION} search index")
+        if digest != corpus_digest(corpus):
+            raise ValueError(f"{path} was built from a different corpus")
+
+        pos = aligned(SEARCH_HEADER.size)
+        names = str(view[pos:pos + names_length], 'utf-8')
+        tokens = names.split('\n') if token_count else []
+        pos = aligned(pos + names_length)
+        offsets = view[pos:pos + (token_count + 1) * 8].cast('Q')
+        pos = aligned(pos + len(offsets) * 8)
+        blob = view[pos:pos + postings_length]
+        postings = {token: blob[offsets[i]:offsets[i + 1]] for i, token in enumerate(tokens)}
+        index = cls(corpus, postings)
+        index._mapping = mapping
+        return index
+
+    def positions(self, token):
+        """{verse row: [positions]} for one token."""
+        found = {}
+        values = decode_varints(self.postings.get(token, b''))
+        row = 0
+        for delta in values:
+            row += delta
+            position = 0
+            positions = found[row] = []
+            for _ in range(next(values)):
+                position += next(values)
+                positions.append(position)
+        return found
+
+    def words(self, query):
+        """Rows containing every word of query."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        rows = None
+        for term in sorted(set(terms), key=lambda t: len(self.postings.get(t, b''))):
+            found = set(self.positions(term))
+            rows = found if rows is None else rows & found
+            if not rows:
+                break
+        return sorted(rows)
+
+    def phrase(self, query):
+        """Rows containing the words of query next to each other, in order."""
+        return self.near(query, 1, ordered=True)
+
+    def near(self, query, distance, ordered=False):
+        """Rows where every word of query is within distance words of the first.
+
+        With ordered=True the words must follow each other at exactly
+        1, 2, ... words from the first, which is what a phrase is.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        postings = [self.positions(term) for term in terms]
+        rows = set(postings[0])
+        for found in postings[1:]:
+            rows &= set(found)
+
+        hits = []
+        for row in sorted(rows):
+            following = [set(found[row]) for found in postings[1:]]
+            for start in postings[0][row]:
+                if ordered:
+                    matched = all(start + i + 1 in positions for i, positions in enumerate(following))
+                else:
+                    matched = all(any(abs(p - start) <= distance for p in positions)
+                                  for positions in following)
+                if matched:
+                    hits.append(row)
+                    break
+        return hits
+
+    def reference(self, row):
+        corpus = self.corpus
+        book = corpus.book_names[corpus.verse_book[row]]
+        return f"{book} {corpus.verse_chapter[row]}:{corpus.verse_number[row]}"
+
+
+def open_index(corpus_file, corpus):
+    """The SearchIndex of a compiled corpus, mapped from its saved index.
+
+    The index is built and saved first when there is none yet, or when
+    the one there was built from a different corpus.
+    """
+    path = search_path(corpus_file)
+    try:
+        return SearchIndex.load(path, corpus)
+    except (FileNotFoundError, ValueError):
+        pass
+    index = SearchIndex(corpus)
+    index.save(path)
+    return index
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    # python kjv_search.py kjv.kjvc 'faith hope charity'
+    # python kjv_search.py kjv.kjvc '"in the beginning"'
+    # python kjv_search.py kjv.kjvc 'love neighbour' 5
+    source, query = sys.argv[1], sys.argv[2]
+    if source.endswith(CORPUS_EXT):
+        corpus = Corpus.load(source)
+        index = open_index(source, corpus)
+    else:
+        corpus = Corpus.from_lines(iter_normalized_lines(source))
+        index = SearchIndex(corpus)
+
+    if len(sys.argv) > 3:
+        rows = index.near(query, int(sys.argv[3]))
+    elif query.startswith('"') and query.endswith('"'):
+        rows = index.phrase(query)
+    else:
+        rows = index.words(query)
+
+    for row in rows:
+        print(f"{index.reference(row)}  {corpus.verse_text(row)}")
+    print(f"{len(rows)} verses")
@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from kjv_cache import RENDERER_FILES, renderer_fingerprint
+from kjv_docx_source import DOCUMENT_PART, DOCX_EXT
+from kjv_formats import FORMATS, format_path
+from kjv_pipeline import BOOK_ORDERS, run_pipeline
+
+# Local conversion service, so regenerating an edition no longer means
+# running a script with its INPUT_FILE/OUTPUT_FILE edited by hand. It
+# speaks just enough HTTP/1.1 for curl, over TCP or a Unix socket:
+#
+#   python kjv_service.py --port 8765 --workers 2
+#   curl --data-binary @kjv_source.txt -o KJV.docx "localhost:8765/convert?order=canonical"
+#   curl --unix-socket kjv.sock --data-binary @kjv.docx -o KJV.epub "x/convert?format=epub"
+#
+# POST /convert takes kjv.docx or its text export as the body and the
+# layout in the query: format (docx, epub, html, jsonl, txt), order (a
+# BOOK_ORDERS profile) and direct=1 for stage17 direct formatting. Jobs
+# run in a bounded process pool. Results are stored under a hash of the
+# body, the options and the renderer sources, so a repeated job is
+# answered from disk, and identical jobs arriving together run once.
+# GET /result/<key> fetches a stored result again; GET /status reports
+# the counters. Hashing, checking and reading bodies and results, and
+# evicting, run in threads so one large job doesn't hold up the others.
+
+HOST = "127.0.0.1"
+PORT = 8765
+RESULT_DIR = ".kjv_results"
+RESULT_MAX_BYTES = 1024 * 1024 * 1024
+MAX_BODY = 64 * 1024 * 1024
+MAX_PENDING = 32
+SERVICE_RENDERER_FILES = RENDERER_FILES + ("kjv_formats.py", "kjv_corpus.py", "kjv_docx_source.py")
+
+CONTENT_TYPES = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'epub': 'application/epub+zip',
+    'html': 'text/html; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'txt': 'text/plain; charset=utf-8',
+}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """An HTTP error status with its message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ================= JOBS =================
+def parse_options(query):
+    """(format, order, styled) from a /convert query string; RequestError if invalid."""
+    params = {name: values[-1] for name, values in parse_qs(query).items()}
+    fmt = params.get('format', 'docx')
+    order = params.get('order', 'custom')
+    if fmt not in FORMATS:
+        raise RequestError(400, f"unknown format {fmt!r} (choose from {', '.join(FORMATS)})")
+    if order not in BOOK_ORDERS:
+        raise RequestError(400, f"unknown order {order!r} (choose from {', '.join(BOOK_ORDERS)})")
+    return fmt, order, params.get('direct', '0') in ('', '0', 'false')
+
+
+def check_source(source):
+    """RequestError (400) unless source is a .docx with a document part or UTF-8 text."""
+    # the same test convert() uses to tell the two apart
+    if source[:2] == b'PK':
+        try:
+            with zipfile.ZipFile(io.BytesIO(source)) as zf:
+                if DOCUMENT_PART not in zf.namelist():
+                    raise RequestError(400, f"the .docx has no {DOCUMENT_PART}")
+        except zipfile.BadZipFile:
+            raise RequestError(400, "body starts like a .docx but is not a readable zip")
+    else:
+        try:
+            source.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise RequestError(400, f"text body is not UTF-8 (byte {e.start})")
+
+
+def job_key(source, fmt, order, styled, fingerprint):
+    h = hashlib.sha256()
+    for part in (fingerprint, fmt, order, str(styled)):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    h.update(source)
+    return h.hexdigest()
+
+
+def convert(source, result_file, fmt, order, styled):
+    """Worker: run the pipeline on source (bytes), store the result at result_file and return it."""
+    # kjv.docx is a zip; anything else is taken for the text export
+    suffix = DOCX_EXT if source[:2] == b'PK' else '.txt'
+    with tempfile.TemporaryDirectory() as work:
+        input_file = os.path.join(work, 'source' + suffix)
+        output_file = os.path.join(work, 'output.docx')
+        with open(input_file, 'wb') as f:
+            f.write(source)
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_pipeline(input_file, output_file, styled=styled, order=BOOK_ORDERS[order], formats=[fmt])
+        with open(format_path(output_file, fmt), 'rb') as f:
+            data = f.read()
+    write_into_place(data, result_file)
+    return data
+
+
+def write_into_place(data, target):
+    """Write data to target through a temporary name, so readers never see it half written."""
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+class ConversionService:
+    """Jobs queued onto a process pool, results stored on disk by job key."""
+
+    def __init__(self, workers=2, result_dir=RESULT_DIR, max_pending=MAX_PENDING,
+                 max_bytes=RESULT_MAX_BYTES):
+        self.pool = ProcessPoolExecutor(workers)
+        self.result_dir = result_dir
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.fingerprint = renderer_fingerprint(SERVICE_RENDERER_FILES)
+        self.running = {}
+        self.stats = {'jobs': 0, 'hits': 0, 'joined': 0, 'converted': 0, 'failed': 0}
+        os.makedirs(result_dir, exist_ok=True)
+
+    def result_path(self, key):
+        if len(key) != 64 or not all(c in '0123456789abcdef' for c in key):
+            raise RequestError(404, "no such result")
+        return os.path.join(self.result_dir, key)
+
+    def load(self, path):
+        """The bytes of a stored result, or None if there is none (or it was just evicted)."""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def find(self, key):
+        """(bytes, format) of a stored result, or None."""
+        for fmt in FORMATS:
+            data = self.load(self.result_path(key) + FORMATS[fmt].ext)
+            if data is not None:
+                return data, fmt
+        return None
+
+    async def submit(self, source, fmt, order, styled):
+        """(key, bytes) of the result for a job, converting it unless it is stored or already running.
+
+        Results are read into memory before anything is evicted, so a
+        request never loses its file to another job's eviction.
+        """
+        loop = asyncio.get_running_loop()
+        self.stats['jobs'] += 1
+        key = await loop.run_in_executor(None, job_key, source, fmt, order, styled, self.fingerprint)
+        path = self.result_path(key) + FORMATS[fmt].ext
+        data = await loop.run_in_executor(None, self.load, path)
+        if data is not None:
+            self.stats['hits'] += 1
+            return key, data
+
+        if key in self.running:
+            self.stats['joined'] += 1
+            return key, await asyncio.shield(self.running[key])
+        if len(self.running) >= self.max_pending:
+            raise RequestError(503, "too many jobs queued, try again later")
+
+        task = asyncio.ensure_future(self.run_job(source, path, fmt, order, styled))
+        self.running[key] = task
+        try:
+            return key, await asyncio.shield(task)
+        finally:
+            del self.running[key]
+
+    async def run_job(self, source, path, fmt, order, styled):
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(self.pool, convert, source, path, fmt, order, styled)
+        except Exception:
+            self.stats['failed'] += 1
+            raise
+        self.stats['converted'] += 1
+        await loop.run_in_executor(None, self.evict)
+        return data
+
+    def evict(self):
+        """Delete the least recently used results until they fit max_bytes.
+
+        Runs in a thread, possibly next to another eviction, so a result
+        that is already gone is skipped.
+        """
+        entries = []
+        for entry in os.scandir(self.result_dir):
+            if not entry.name.endswith('.tmp'):
+                with contextlib.suppress(FileNotFoundError):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+    def status(self):
+        return {**self.stats, 'running': len(self.running)}
+
+    def close(self):
+        self.pool.shutdown()
+
+
+# ================= HTTP =================
+async def read_request(reader, writer):
+    """(method, target, body) of one HTTP request; RequestError if malformed."""
+    request_line = await reader.readline()
+    try:
+        method, target, _ = request_line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(400, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise RequestError(400, "Content-Length must be a byte count")
+    if length > MAX_BODY:
+        raise RequestError(413, f"body over {MAX_BODY} bytes")
+    if headers.get('expect', '').lower() == '100-continue':
+        # curl waits for this before sending a large body
+        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+    body = await reader.readexactly(length) if length else b''
+    return method, target, body
+
+
+async def respond(writer, status, body, content_type='application/json', headers=()):
+    if isinstance(body, (dict, list)):
+        body = (json.dumps(body) + '\n').encode('utf-8')
+    head = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}", "Connection: close", *headers]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+    writer.write(body)
+    await writer.drain()
+
+
+async def send_result(writer, key, data, fmt):
+    await respond(writer, 200, data, CONTENT_TYPES[fmt],
+                  [f"X-Job-Key: {key}",
+                   f'Content-Disposition: attachment; filename="KJV{FORMATS[fmt].ext}"'])
+
+
+def make_handler(service):
+    async def handle(reader, writer):
+        try:
+            method, target, body = await read_request(reader, writer)
+            url = urlsplit(target)
+            if url.path == '/convert':
+                if method != 'POST':
+                    raise RequestError(405, "POST the source to /convert")
+                if not body:
+                    raise RequestError(400, "empty body; POST kjv.docx or its text export")
+                fmt, order, styled = parse_options(url.query)
+                await asyncio.get_running_loop().run_in_executor(None, check_source, body)
+                key, data = await service.submit(body, fmt, order, styled)
+                await send_result(writer, key, data, fmt)
+            elif url.path.startswith('/result/') and method == 'GET':
+                key = url.path[len('/result/'):]
+                found = await asyncio.get_running_loop().run_in_executor(None, service.find, key)
+                if not found:
+                    raise RequestError(404, "no such result")
+                await send_result(writer, key, *found)
+            elif url.path == '/status' and method == 'GET':
+                await respond(writer, 200, service.status())
+            else:
+                raise RequestError(404, f"no route for {method} {url.path}")
+        except RequestError as e:
+            await respond(writer, e.status, {'error': str(e)})
+        except (UnicodeDecodeError, zipfile.BadZipFile) as e:
+            # a body check_source let through that the pipeline couldn't read after all
+            await respond(writer, 400, {'error': f"{type(e).__name__}: {e}"})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            await respond(writer, 500, {'error': f"{type(e).__name__}: {e}"})
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+    return handle
+
+
+async def serve(service, host=HOST, port=PORT, unix_socket=None):
+    handler = make_handler(service)
+    if unix_socket:
+        server = await asyncio.start_unix_server(handler, unix_socket)
+        where = unix_socket
+    else:
+        server = await asyncio.start_server(handler, host, port)
+        where = f"http://{host}:{port}"
+    print(f"Serving conversions on {where}")
+    async with server:
+        await server.serve_forever()
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve KJV conversions over HTTP with a shared result cache.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", metavar="PATH", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=2, help="conversions running at once")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING,
+                        help="distinct jobs queued or running before new ones are turned away")
+    parser.add_argument("--results", default=RESULT_DIR, help="directory the results are kept in")
+    args = parser.parse_args()
+
+    service = ConversionService(args.workers, args.results, args.max_pending)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
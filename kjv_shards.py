@@ -0,0 +1,127 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from kjv_cache import RENDERER_FILES, book_key, renderer_fingerprint
+from kjv_formats import FORMATS
+from kjv_manifest import MANIFEST_EXT, write_manifest
+from kjv_pipeline import CUSTOM_ORDER, RunBuilder, iter_blocks, iter_reordered_lines
+
+# One file per book instead of one for the whole Bible, plus index.json
+# listing them in book order:
+#
+#   python kjv_pipeline.py kjv.docx KJV.docx --shards --workers 4
+#
+# writes KJV_books/01-Genesis.docx ... 66-Revelation.docx. Books are
+# rendered concurrently and each shard is recorded in the index with a
+# key over its text and the renderer, so a rebuild only renders the books
+# whose key changed and the rest are left as they are on disk.
+
+SHARD_DIR_SUFFIX = "_books"
+INDEX_FILE = "index.json"
+SHARD_RENDERER_FILES = RENDERER_FILES + ("kjv_formats.py",)
+
+
+def shard_dir(output_file):
+    return os.path.splitext(output_file)[0] + SHARD_DIR_SUFFIX
+
+
+def shard_name(position, book, fmt):
+    """File name of a shard; the position keeps a directory listing in book order."""
+    return f"{position:02}-{book.replace(' ', '_')}{FORMATS[fmt].ext}"
+
+
+def render_shard(job):
+    """Worker: render one book to each of its shard files; returns (runs, saved).
+
+    All formats come from one pass over the book's blocks, and each file
+    is only moved into place once it is complete.
+    """
+    book_name, chapters, paths, styled, manifest = job
+    renderers = [FORMATS[fmt](path + '.tmp', styled, front_matter=False) for fmt, path in paths.items()]
+    lines = iter_reordered_lines({book_name: chapters}, [book_name])
+    for block in iter_blocks(lines, chapters=True):
+        for renderer in renderers:
+            renderer.block(block)
+    for renderer in renderers:
+        renderer.close()
+    for path in paths.values():
+        os.replace(path + '.tmp', path)
+
+    if 'docx' in paths:
+        manifest_file = os.path.splitext(paths['docx'])[0] + MANIFEST_EXT
+        if manifest:
+            write_manifest(paths['docx'], manifest_file)
+        elif os.path.exists(manifest_file):
+            os.remove(manifest_file)
+    first = renderers[0].runs
+    return first.runs, first.saved
+
+
+def load_index(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return {entry['book']: entry for entry in json.load(f)['books']}
+
+
+def write_shards(bible_dict, directory, order=CUSTOM_ORDER, formats=('docx',), styled=True,
+                 workers=0, manifest=False):
+    """Write each book in order to its own file(s) under directory and index them.
+
+    Returns (RunBuilder totals of the books rendered, index path, books
+    rendered). A book is rendered again only when its text, the
+    formats, styled or the renderer sources changed since the index was
+    written, or one of its files is missing. Files of books no longer in
+    the output are deleted.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index_file = os.path.join(directory, INDEX_FILE)
+    previous = load_index(index_file)
+    fingerprint = renderer_fingerprint(SHARD_RENDERER_FILES)
+
+    entries = []
+    jobs = []
+    books = [book for book in order if book in bible_dict]
+    for position, book in enumerate(books, 1):
+        chapters = bible_dict[book]
+        files = {fmt: shard_name(position, book, fmt) for fmt in formats}
+        key = book_key(book, chapters, fingerprint, ','.join(formats), str(styled), str(manifest))
+        entries.append({'book': book, 'chapters': len(chapters), 'files': files, 'key': key})
+
+        old = previous.get(book)
+        if (old and old['key'] == key and old['files'] == files
+                and all(os.path.exists(os.path.join(directory, name)) for name in files.values())):
+            continue
+        paths = {fmt: os.path.join(directory, name) for fmt, name in files.items()}
+        jobs.append((book, chapters, paths, styled, manifest))
+
+    runs = RunBuilder()
+    if workers and jobs:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(render_shard, jobs))
+    else:
+        results = [render_shard(job) for job in jobs]
+    for book_runs, book_saved in results:
+        runs.runs += book_runs
+        runs.saved += book_saved
+
+    current = {name for entry in entries for name in entry['files'].values()}
+    for entry in previous.values():
+        for name in entry['files'].values():
+            if name in current:
+                continue
+            path = os.path.join(directory, name)
+            stale = [path]
+            if name.endswith(FORMATS['docx'].ext):
+                stale.append(os.path.splitext(path)[0] + MANIFEST_EXT)
+            for path in stale:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    tmp = index_file + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'formats': list(formats), 'styled': styled, 'books': entries}, f, indent=1)
+        f.write('\n')
+    os.replace(tmp, index_file)
+    return runs, index_file, len(jobs)
@@ -1,18 +1,110 @@
 import re
+import sys
 
-# Load your KJV text file
-with open('kjv_source.txt', 'r', encoding='utf-8') as file:
-    bible_text = file.read()
+# The source is read in chunks and rewritten in one scan, instead of being
+# read whole and copied once per rewrite, so memory stays at a chunk (plus
+# the longest line) however large the source is. Output is the same as
+# the three passes one after the other. kjv_pipeline.py imports the
+# rewrites from here (rewrite_segments, holy_across), so its --normalized
+# copy is this same output:
+#
+#   python process_bible.py                                # kjv_source.txt -> kjv_formatted.txt
+#   python process_bible.py merged_source.txt merged_formatted.txt
+
+INPUT_FILE = 'kjv_source.txt'
+OUTPUT_FILE = 'kjv_formatted.txt'
+CHUNK_SIZE = 1 << 20  # characters
 
 # 1. Change "Spirit" to lowercase "spirit" (for later Word formatting)
-bible_text = re.sub(r'\b(Spirit)\b', 'spirit', bible_text)
 # 2. Change "Holy Spirit/Ghost" to lowercase
-bible_text = re.sub(r'Holy\s+(Ghost|Spirit)', 'holy spirit', bible_text, flags=re.IGNORECASE)
 # 3. Change words in [brackets] to _italics_ format
-bible_text = re.sub(r'\[(.*?)\]', r'_\1_', bible_text)
+# The three never overlap: 1 and 2 hold only letters and whitespace, and
+# none of them can start inside another, so a single scan takes each match
+# where it starts. 2 can take out a newline ("Holy\nGhost"), which 3 then
+# reads as one line, so the bracketed words may run over a newline inside
+# a "Holy Ghost"; the lookahead keeps every other H a plain letter, so a
+# bracket that never closes fails without backtracking.
+HOLY = r'(?i:Holy\s+(?:Ghost|Spirit))'
+REWRITES = re.compile(rf'{HOLY}|\b(Spirit)\b|\[((?:[^\]\nHh]|{HOLY}|[Hh](?!(?i:oly\s+(?:Ghost|Spirit))))*)\]')
+HOLY_WORD = re.compile(r'(?i:Holy)')
+NEXT_WORD = re.compile(r'\s*((?i:Ghost|Spirit))?')
+
+
+def rewrite(match):
+    if match.group(2) is not None:
+        # 1 and 2 also apply between the brackets
+        return '_' + REWRITES.sub(rewrite, match.group(2)) + '_'
+    if match.group(1):
+        return 'spirit'
+    return 'holy spirit'
+
+
+def rewrite_segments(text):
+    """((text, italic), ...) of text with the rewrites applied and the
+    bracketed words as italic segments; markup() of it is REWRITES.sub."""
+    segments = []
+    plain = []
+    pos = 0
+    for match in REWRITES.finditer(text):
+        plain.append(text[pos:match.start()])
+        pos = match.end()
+        if match.group(2) is None:
+            plain.append(rewrite(match))
+            continue
+        if any(plain):
+            segments.append((''.join(plain), False))
+        plain = []
+        segments.append((REWRITES.sub(rewrite, match.group(2)), True))
+    plain.append(text[pos:])
+    rest = ''.join(plain)
+    if rest:
+        segments.append((rest, False))
+    return tuple(segments)
+
+
+def holy_across(text, newline):
+    """Whether a "Holy Ghost" in text may run across the newline at text[newline].
+
+    Also true when text ends before the word after the newline is known.
+    """
+    start = newline
+    while start and text[start - 1].isspace():
+        start -= 1
+    if start < 4 or not HOLY_WORD.match(text, start - 4, start):
+        return False
+    after = NEXT_WORD.match(text, newline + 1)
+    return after.group(1) is not None or len(text) - after.end() < len('Spirit')
+
+
+def safe_cut(text):
+    """Where text can be split without splitting a match: after its last
+    newline that no "Holy Ghost" runs across, or 0 if there is none."""
+    end = len(text)
+    while (newline := text.rfind('\n', 0, end)) >= 0:
+        if not holy_across(text, newline):
+            return newline + 1
+        end = newline
+    return 0
+
+
+def normalize_file(input_file, output_file, chunk_size=CHUNK_SIZE):
+    """Write input_file with the rewrites applied to output_file, chunk by chunk."""
+    with open(input_file, 'r', encoding='utf-8') as src, \
+            open(output_file, 'w', encoding='utf-8') as out:
+        pending = ''
+        while chunk := src.read(chunk_size):
+            pending += chunk
+            if '\n' not in chunk:
+                continue
+            cut = safe_cut(pending)
+            out.write(REWRITES.sub(rewrite, pending[:cut]))
+            pending = pending[cut:]
+        out.write(REWRITES.sub(rewrite, pending))
 
-# Save the processed text to a new file
-with open('kjv_formatted.txt', 'w', encoding='utf-8') as file:
-    file.write(bible_text)
 
-print("Processing complete! Check 'kjv_formatted.txt' in your file explorer.")
+# --- Main Execution ---
+if __name__ == "__main__":
+    input_file = sys.argv[1] if len(sys.argv) > 1 else INPUT_FILE
+    output_file = sys.argv[2] if len(sys.argv) > 2 else OUTPUT_FILE
+    normalize_file(input_file, output_file)
+    print(f"Processing complete! Check '{output_file}' in your file explorer.")